@@ -0,0 +1,141 @@
+import asyncio, json, math, time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette.responses import StreamingResponse
+
+class Gate:
+    """Concurrency limit with a bounded FIFO wait queue for one endpoint.
+
+    Up to `limit` requests run at once and up to `queue` more wait their turn;
+    beyond that, or after waiting `max_wait` seconds, callers get a 503 whose
+    Retry-After is the time the queue ahead of them should take to drain,
+    from an EWMA of observed service time. Use as `async with gate.slot():`.
+    """
+
+    def __init__(self, name: str, limit: int, queue: int, max_wait: Optional[float] = None, alpha: float = 0.2):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue = max(0, queue)
+        self.max_wait = max_wait
+        self.alpha = alpha
+        self.active = 0
+        self.service_s = 1.0  # EWMA; a guess until the first request finishes
+        self.admitted = self.rejected = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def full(self) -> bool:
+        return self.active >= self.limit and self.waiting >= self.queue
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.service_s * (self.waiting + 1) / self.limit))
+
+    def _reject(self, detail: str) -> HTTPException:
+        self.rejected += 1
+        return HTTPException(503, detail, headers={"Retry-After": str(self.retry_after())})
+
+    async def acquire(self) -> float:
+        """Waits for a slot and returns the admission time, for `release`."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+        elif self.waiting >= self.queue:
+            raise self._reject(f"{self.name} is at capacity")
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await asyncio.wait_for(fut, self.max_wait)
+            except asyncio.TimeoutError:
+                self._drop(fut)
+                raise self._reject(f"{self.name} queue wait exceeded {self.max_wait:g}s")
+            except BaseException:
+                if fut.done() and not fut.cancelled():
+                    self._handoff()  # granted just as we were cancelled: pass the slot on
+                else:
+                    self._drop(fut)
+                raise
+        self.admitted += 1
+        return time.monotonic()
+
+    def release(self, admitted_at: float) -> None:
+        elapsed = time.monotonic() - admitted_at
+        self.service_s += self.alpha * (elapsed - self.service_s)
+        self._handoff()
+
+    def _handoff(self) -> None:
+        # the slot goes straight to the oldest live waiter, so `active` is unchanged
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    def _drop(self, fut: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    @asynccontextmanager
+    async def slot(self):
+        admitted_at = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    def state(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "queue": self.queue, "waiting": self.waiting,
+                "admitted": self.admitted, "rejected": self.rejected, "service_ms": round(self.service_s * 1000, 1)}
+
+def parse_limits(spec: str) -> dict[str, tuple[int, int]]:
+    # "ocr=4:16,imaging=4:16" -> {"ocr": (4, 16), "imaging": (4, 16)}
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, rest = part.partition("=")
+        limit, _, queue = rest.partition(":")
+        out[name.strip()] = (int(limit), int(queue or 0))
+    return out
+
+class GatedStreamingResponse(StreamingResponse):
+    """StreamingResponse that holds a gate slot until the stream is done, however it ends."""
+
+    def __init__(self, content, gate: Gate, admitted_at: float, **kwargs):
+        super().__init__(content, **kwargs)
+        self.gate, self.admitted_at = gate, admitted_at
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.gate.release(self.admitted_at)
+
+class AdmissionMiddleware:
+    """Turns requests away before their body is read once an endpoint's queue is already full.
+
+    The handler still takes the slot itself (`async with gate.slot():`); this only
+    saves a saturated endpoint from accepting uploads it would refuse anyway.
+    """
+
+    def __init__(self, app, gates: dict[str, Gate]):
+        self.app = app
+        self.gates = gates
+
+    async def __call__(self, scope, receive, send):
+        gate = self.gates.get(scope["path"]) if scope["type"] == "http" else None
+        if gate is None or not gate.full:
+            return await self.app(scope, receive, send)
+        exc = gate._reject(f"{gate.name} is at capacity")
+        body = json.dumps({"detail": exc.detail}).encode()
+        await send({"type": "http.response.start", "status": 503,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                                (b"retry-after", exc.headers["Retry-After"].encode()), (b"connection", b"close")]})
+        await send({"type": "http.response.body", "body": body})
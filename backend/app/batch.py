@@ -0,0 +1,151 @@
+import os, json, codecs, asyncio, tempfile
+from typing import Any, AsyncIterator, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+from .uploads import CHUNK_SIZE
+
+class RecordError(ValueError):
+    pass
+
+class BodyTooLarge(RecordError):
+    pass
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse for endpoints that keep reading the request body while responding.
+
+    Starlette's default (ASGI < 2.4) spawns a task that drains `receive()` to
+    watch for disconnects, which would swallow the body chunks the endpoint is
+    still consuming. Here a disconnect surfaces as a failed send instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+class BodySpool:
+    """Drains a request body into an anonymous temp file as fast as the client sends it.
+
+    A client that writes its whole body before reading the response (httpx,
+    requests) stops writing once the socket buffers fill, while a server that
+    reads only as fast as it responds is blocked writing a response nobody
+    reads. Spooling takes the body off the socket regardless; `chunks()`
+    replays it from the file as it arrives, one chunk in memory at a time.
+    A body over `max_bytes` stops being read, and `chunks()` raises
+    BodyTooLarge once it has replayed what fit. Use as
+    `async with BodySpool(receive, max_bytes=...) as spool:`.
+    """
+
+    def __init__(self, receive, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self._receive = receive
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    async def __aenter__(self) -> "BodySpool":
+        self._file = await run_in_threadpool(tempfile.TemporaryFile, dir=self._directory)
+        self._task = asyncio.create_task(self._drain())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await run_in_threadpool(self._file.close)
+
+    async def _drain(self) -> None:
+        fd = self._file.fileno()
+        try:
+            while True:
+                message = await self._receive()
+                if message["type"] == "http.disconnect":
+                    raise ClientDisconnect()
+                body = message.get("body", b"")
+                if self._max_bytes is not None and self._size + len(body) > self._max_bytes:
+                    raise BodyTooLarge(f"Batch exceeds {self._max_bytes} bytes")
+                if body:
+                    await run_in_threadpool(os.pwrite, fd, body, self._size)
+                    self._size += len(body)
+                    self._changed.set()
+                if not message.get("more_body", False):
+                    break
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done = True
+            self._changed.set()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        fd, offset = self._file.fileno(), 0
+        while True:
+            if offset < self._size:
+                data = await run_in_threadpool(os.pread, fd, min(CHUNK_SIZE, self._size - offset), offset)
+                offset += len(data)
+                yield data
+            elif self._done:
+                if self._error is not None:
+                    raise self._error
+                return
+            else:
+                self._changed.clear()
+                await self._changed.wait()
+
+async def iter_records(chunks: AsyncIterator[bytes], max_record_bytes: int) -> AsyncIterator[Any]:
+    """Yield records from an NDJSON or JSON-array body as it streams in.
+
+    The format is sniffed from the first non-blank byte. Unparseable records
+    are yielded as `RecordError` instances so the caller can report them in
+    place; only a record longer than `max_record_bytes` or a broken array
+    framing aborts the stream. At most one record is buffered at a time.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    json_decoder = json.JSONDecoder()
+    buf = ""
+    mode = None  # "ndjson" | "array"
+    done = False
+    async for chunk in chunks:
+        buf += decoder.decode(chunk)
+        if mode is None:
+            stripped = buf.lstrip()
+            if not stripped:
+                continue
+            mode = "array" if stripped[0] == "[" else "ndjson"
+            buf = stripped[1:] if mode == "array" else stripped
+        if mode == "ndjson":
+            *lines, buf = buf.split("\n")
+            for line in lines:
+                if line.strip():
+                    yield _parse_line(line)
+        else:
+            while not done:
+                buf = buf.lstrip(" \t\r\n,")
+                if buf.startswith("]"):
+                    done = True
+                    break
+                try:
+                    record, end = json_decoder.raw_decode(buf)
+                except json.JSONDecodeError:
+                    break  # incomplete; wait for more bytes
+                buf = buf[end:]
+                yield record
+        if len(buf) > max_record_bytes:
+            raise RecordError(f"Record exceeds {max_record_bytes} bytes")
+    buf += decoder.decode(b"", final=True)
+    if mode == "ndjson" and buf.strip():
+        yield _parse_line(buf)
+    elif mode == "array" and not done:
+        raise RecordError("Unterminated JSON array")
+
+def _parse_line(line: str) -> Any:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        return RecordError(f"Invalid JSON: {e.msg}")
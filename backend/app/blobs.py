@@ -0,0 +1,167 @@
+import os, re, json, time, shutil, secrets, tempfile, threading
+from dataclasses import asdict
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .uploads import SpooledUpload
+
+SHA256 = re.compile(r"^[0-9a-f]{64}$")
+REF_MAX_AGE_S = 86400  # handles older than this were left behind by a crashed worker
+
+class BlobStore:
+    """Uploaded files kept by SHA-256 so clients can reuse them without sending the bytes again.
+
+    Each blob is `<sha>` plus `<sha>.json` with the original filename, content
+    type and the identities that uploaded it; only those can look it up, so a
+    hash alone never reveals or hands out another tenant's file. The store is
+    bounded by total bytes, evicting the least recently used first (mtime is
+    the clock; a lookup refreshes it), and entries unused for `ttl` seconds
+    expire. `get` hands out a hard link to the blob, so eviction never pulls
+    a file from under a request and the caller closes its SpooledUpload as
+    usual. Blocking; use `aget`/`aput` from the event loop.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: Optional[float] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = self.misses = self.stored = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(e.stat().st_size for e in os.scandir(directory) if e.is_file() and not e.name.startswith("."))
+
+    def _path(self, sha: str) -> str:
+        return os.path.join(self.directory, sha)
+
+    def head(self, sha: str, owner: str) -> Optional[dict]:
+        """Metadata of a blob `owner` uploaded, refreshing its place in the LRU; None if absent or expired."""
+        if not SHA256.match(sha):
+            return None
+        path = self._path(sha)
+        try:
+            if self.ttl and os.path.getmtime(path) < time.time() - self.ttl:
+                self._drop(sha)
+                return None
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+            if owner not in meta.get("owners", ()):
+                return None
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return {k: v for k, v in meta.items() if k != "owners"}
+
+    def get(self, sha: str, owner: str) -> Optional[SpooledUpload]:
+        meta = self.head(sha, owner)
+        if meta is None:
+            self.misses += 1
+            return None
+        ref = os.path.join(self.directory, f".ref-{sha}-{secrets.token_hex(4)}")
+        try:
+            os.link(self._path(sha), ref)
+        except FileNotFoundError:  # evicted in between
+            self.misses += 1
+            return None
+        self.hits += 1
+        return SpooledUpload(meta["filename"], meta["content_type"], meta["size"], sha, path=ref)
+
+    def put(self, upload: SpooledUpload, owner: str) -> None:
+        path = self._path(upload.sha256)
+        if os.path.exists(path) and self._own(path, owner):
+            os.utime(path)
+            return
+        meta = {k: v for k, v in asdict(upload).items() if k in ("filename", "content_type", "size")}
+        meta = json.dumps({**meta, "owners": [owner]})
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            if upload.path is None:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(upload.data)
+            else:
+                os.close(fd)
+                os.unlink(tmp)
+                try:
+                    os.link(upload.path, tmp)  # the spool file is already on disk; no copy if we share a filesystem
+                except OSError:
+                    shutil.copyfile(upload.path, tmp)
+            with open(f"{path}.json", "w") as f:
+                f.write(meta)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._lock:
+            self._bytes += upload.size + len(meta)
+            self.stored += 1
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _own(self, path: str, owner: str) -> bool:
+        # adds `owner` to an existing blob's metadata; False if the blob vanished meanwhile
+        with self._lock:
+            try:
+                with open(f"{path}.json") as f:
+                    raw = f.read()
+                meta = json.loads(raw)
+            except (FileNotFoundError, ValueError):
+                return False
+            if owner in meta.setdefault("owners", []):
+                return True
+            meta["owners"].append(owner)
+            data = json.dumps(meta)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            os.replace(tmp, f"{path}.json")
+            self._bytes += len(data) - len(raw)
+            return True
+
+    def _drop(self, sha: str) -> None:
+        for path in (self._path(sha), f"{self._path(sha)}.json"):
+            try:
+                size = os.path.getsize(path)
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                self._bytes -= size
+
+    def _evict(self) -> None:
+        # caller holds the lock
+        now = time.time()
+        blobs = []
+        for e in os.scandir(self.directory):
+            if e.name.startswith(".ref-") and e.stat().st_mtime < now - REF_MAX_AGE_S:
+                try:
+                    os.unlink(e.path)
+                except FileNotFoundError:
+                    pass
+            elif SHA256.match(e.name):
+                blobs.append(e)
+        for e in sorted(blobs, key=lambda e: e.stat().st_mtime):
+            if self._bytes <= self.max_bytes:
+                break
+            for path in (e.path, f"{e.path}.json"):
+                try:
+                    size = os.path.getsize(path)
+                    os.unlink(path)
+                    self._bytes -= size
+                except FileNotFoundError:
+                    pass
+
+    async def aget(self, sha: str, owner: str) -> Optional[SpooledUpload]:
+        return await run_in_threadpool(self.get, sha, owner)
+
+    async def ahead(self, sha: str, owner: str) -> Optional[dict]:
+        return await run_in_threadpool(self.head, sha, owner)
+
+    async def aput(self, upload: SpooledUpload, owner: str) -> None:
+        await run_in_threadpool(self.put, upload, owner)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "stored": self.stored, "bytes": self._bytes,
+                "max_bytes": self.max_bytes}
@@ -0,0 +1,151 @@
+import os, time, hashlib, tempfile, threading
+from collections import OrderedDict
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+class ResultCache:
+    """Two-tier byte cache: an in-memory LRU in front of an optional disk directory.
+
+    Values are opaque bytes (usually a serialized response model). The memory
+    tier is bounded by item count and total bytes; the disk tier by total bytes,
+    evicting least recently used files first. With `ttl` set, entries older
+    than `ttl` seconds are treated as misses in both tiers. Only touch the
+    memory tier from the event loop; `aget`/`aput` push disk I/O to the threadpool.
+    """
+
+    def __init__(self, max_items: int = 256, max_bytes: int = 64 << 20,
+                 disk_dir: Optional[str] = None, disk_max_bytes: int = 0, ttl: Optional[float] = None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir if disk_dir and disk_max_bytes > 0 else None
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = self.disk_hits = self.misses = 0
+        self._mem: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._mem_bytes = 0
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(e.stat().st_size for e in os.scandir(self.disk_dir) if e.is_file())
+
+    # ---------- memory tier ----------
+    def _expiry(self) -> float:
+        return time.time() + self.ttl if self.ttl else 0.0
+
+    def _mem_get(self, key: str) -> Optional[bytes]:
+        entry = self._mem.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires and expires < time.time():
+            self._mem_drop(key)
+            return None
+        self._mem.move_to_end(key)
+        return value
+
+    def _mem_drop(self, key: str) -> None:
+        entry = self._mem.pop(key, None)
+        if entry is not None:
+            self._mem_bytes -= len(entry[1])
+
+    def _mem_put(self, key: str, value: bytes, expires: Optional[float] = None) -> None:
+        if len(value) > self.max_bytes or self.max_items <= 0:
+            return
+        self._mem_drop(key)
+        self._mem[key] = (self._expiry() if expires is None else expires, value)
+        self._mem_bytes += len(value)
+        while len(self._mem) > self.max_items or self._mem_bytes > self.max_bytes:
+            _, (_, dropped) = self._mem.popitem(last=False)
+            self._mem_bytes -= len(dropped)
+
+    # ---------- disk tier ----------
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode()).hexdigest())
+
+    # files are "<expiry>\n<value>"; expiry 0 means no TTL
+    def _disk_get(self, key: str) -> Optional[tuple[float, bytes]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                expires = float(f.readline())
+                value = f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        if expires and expires < time.time():
+            self._disk_drop(path)
+            return None
+        os.utime(path)  # mtime doubles as the LRU clock
+        return expires, value
+
+    def _disk_drop(self, path: str) -> None:
+        with self._disk_lock:
+            try:
+                size = os.path.getsize(path)
+                os.unlink(path)
+                self._disk_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def _disk_put(self, key: str, value: bytes, expires: float) -> None:
+        if len(value) > self.disk_max_bytes:
+            return
+        path = self._path(key)
+        header = b"%d\n" % expires
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(value)
+        with self._disk_lock:
+            try:
+                self._disk_bytes -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp, path)
+            self._disk_bytes += len(header) + len(value)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        entries = sorted((e for e in os.scandir(self.disk_dir) if e.is_file() and not e.name.startswith(".tmp-")),
+                         key=lambda e: e.stat().st_mtime)
+        for e in entries:
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+            try:
+                size = e.stat().st_size
+                os.unlink(e.path)
+                self._disk_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    # ---------- public API ----------
+    async def aget(self, key: str) -> Optional[bytes]:
+        value = self._mem_get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        entry = await run_in_threadpool(self._disk_get, key) if self.disk_dir else None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.disk_hits += 1
+        self._mem_put(key, entry[1], entry[0])
+        return entry[1]
+
+    async def aput(self, key: str, value: bytes) -> None:
+        expires = self._expiry()
+        self._mem_put(key, value, expires)
+        if self.disk_dir:
+            await run_in_threadpool(self._disk_put, key, value, expires)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "items": len(self._mem), "bytes": self._mem_bytes,
+            "disk_bytes": self._disk_bytes if self.disk_dir else None,
+        }
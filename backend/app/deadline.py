@@ -0,0 +1,112 @@
+import asyncio, json
+from typing import Callable, Optional
+
+def _has_body(scope) -> bool:
+    for name, value in scope.get("headers", []):
+        if name == b"content-length":
+            return value != b"0"
+        if name == b"transfer-encoding":
+            return True
+    return False
+
+class DeadlineMiddleware:
+    """Gives every HTTP request a time budget and abandons it once nobody will read the answer.
+
+    The budget is the client's X-Request-Timeout in seconds, capped at
+    `max_timeout`, or `default`. Once the request body has been read the
+    connection is watched for a disconnect. A disconnect, or the budget running
+    out before the response has started, cancels the handler, and with it
+    whatever it is awaiting: upstream calls, admission queues, pool tasks (see
+    WorkerPool). Expired requests are answered 504, abandoned ones 499 (which
+    only the metrics see). `on_cancel(scope, reason)` is called with
+    "deadline" or "disconnect".
+    """
+
+    def __init__(self, app, default: float, max_timeout: float,
+                 on_cancel: Optional[Callable[[dict, str], None]] = None):
+        self.app = app
+        self.default = default
+        self.max_timeout = max_timeout
+        self.on_cancel = on_cancel
+
+    def _budget(self, scope) -> float:
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-timeout":
+                try:
+                    asked = float(value)
+                except ValueError:
+                    break
+                if asked > 0:
+                    return min(asked, self.max_timeout)
+        return self.default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._budget(scope)
+        scope.setdefault("state", {})["deadline"] = deadline  # request.state.deadline, in loop.time()
+        started = False
+        body_done, disconnected = asyncio.Event(), asyncio.Event()
+        early: list[dict] = []
+        if not _has_body(scope):
+            early.append(await receive())  # the empty body, handed to the app when it asks
+            body_done.set()
+
+        async def watched_receive():
+            if early:
+                return early.pop()
+            if body_done.is_set():
+                # the watcher owns the connection now; all that can come is a disconnect
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                body_done.set()
+            return message
+
+        async def watched_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        async def watch():
+            await body_done.wait()
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        handler = asyncio.ensure_future(self.app(scope, watched_receive, watched_send))
+        watcher = asyncio.ensure_future(watch())
+        gone = asyncio.ensure_future(disconnected.wait())
+        try:
+            while True:
+                timeout = None if started else max(0.0, deadline - loop.time())
+                done, _ = await asyncio.wait({handler, gone}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if handler in done:
+                    return handler.result()
+                if gone in done:
+                    reason = "disconnect"
+                    break
+                if not started:
+                    reason = "deadline"
+                    break
+        finally:
+            watcher.cancel()
+            gone.cancel()
+            if not handler.done():
+                handler.cancel()
+                await asyncio.wait({handler})
+        if not handler.cancelled():
+            handler.exception()  # it swallowed the cancellation or failed on the way out; either way, moot
+        if self.on_cancel is not None:
+            self.on_cancel(scope, reason)
+        if not started:
+            status, detail = (504, "Request deadline exceeded") if reason == "deadline" else (499, "Client closed request")
+            body = json.dumps({"detail": detail}).encode()
+            await send({"type": "http.response.start", "status": status,
+                        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+            await send({"type": "http.response.body", "body": body})
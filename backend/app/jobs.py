@@ -0,0 +1,294 @@
+# Background jobs for analyses that outlive an HTTP request. State lives in a
+# WAL-mode SQLite file next to the job inputs, so every uvicorn worker shares
+# one queue and queued or interrupted jobs are picked up again after a restart.
+import asyncio, glob, json, logging, os, secrets, shutil, socket, sqlite3, threading, time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from .uploads import SpooledUpload
+
+log = logging.getLogger("amorai.jobs")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    dedupe_key   TEXT NOT NULL,
+    status       TEXT NOT NULL,            -- queued | running | done | failed
+    progress     REAL NOT NULL DEFAULT 0,
+    params       TEXT NOT NULL,
+    inputs       TEXT NOT NULL,            -- {name: SpooledUpload fields, path inside the jobs dir}
+    result       TEXT,
+    error        TEXT,
+    error_status INTEGER,
+    owner        TEXT,                     -- the runner holding it while running
+    submitter    TEXT,                     -- identity that submitted it; only it can read the job
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    created      REAL NOT NULL,
+    updated      REAL NOT NULL,
+    expires      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key);
+CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires);
+"""
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str
+    progress: float
+    params: dict
+    inputs: dict
+    result: Optional[dict]
+    error: Optional[str]
+    error_status: Optional[int]
+    attempts: int
+    created: float
+    updated: float
+    submitter: Optional[str]
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        return cls(row["id"], row["kind"], row["status"], row["progress"], json.loads(row["params"]),
+                   json.loads(row["inputs"]), json.loads(row["result"]) if row["result"] else None,
+                   row["error"], row["error_status"], row["attempts"], row["created"], row["updated"],
+                   row["submitter"])
+
+    def upload(self, name: str) -> SpooledUpload:
+        return SpooledUpload(**self.inputs[name])
+
+class JobStore:
+    """Job rows plus their input files under `directory`.
+
+    Methods are blocking; the async wrappers on JobRunner and the endpoints
+    call them through the threadpool.
+    """
+
+    def __init__(self, directory: str, ttl: float):
+        self.directory = directory
+        self.ttl = ttl
+        self.inputs_dir = os.path.join(directory, "inputs")
+        os.makedirs(self.inputs_dir, exist_ok=True)
+        self.path = os.path.join(directory, "jobs.db")
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        if "submitter" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+            # databases from before submitters were recorded; their jobs stay unreadable until they expire
+            conn.execute("ALTER TABLE jobs ADD COLUMN submitter TEXT")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ? AND expires > ?", (job_id, time.time())).fetchone()
+        return Job.from_row(row) if row else None
+
+    def _live(self, conn: sqlite3.Connection, dedupe_key: str) -> Optional[sqlite3.Row]:
+        # failed jobs don't count: resubmitting is how a client retries
+        return conn.execute("SELECT * FROM jobs WHERE dedupe_key = ? AND status != 'failed' AND expires > ? "
+                            "ORDER BY created DESC LIMIT 1", (dedupe_key, time.time())).fetchone()
+
+    def submit(self, kind: str, dedupe_key: str, params: dict, uploads: dict[str, SpooledUpload],
+               submitter: str) -> tuple[Job, bool]:
+        """Queues a job, or returns the live job with the same key. The bool is True for a duplicate.
+
+        Callers put the submitter in `dedupe_key` too, so one identity never gets another's job back.
+        """
+        conn = self._conn()
+        if (row := self._live(conn, dedupe_key)) is not None:
+            return Job.from_row(row), True
+        job_id = secrets.token_urlsafe(16)
+        inputs = {name: self._persist(job_id, name, u) for name, u in uploads.items()}
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if (row := self._live(conn, dedupe_key)) is not None:  # lost a race with another worker
+                conn.execute("COMMIT")
+                self._discard(inputs)
+                return Job.from_row(row), True
+            conn.execute("INSERT INTO jobs (id, kind, dedupe_key, status, params, inputs, submitter, created, updated, "
+                         "expires) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                         (job_id, kind, dedupe_key, json.dumps(params), json.dumps(inputs), submitter, now, now,
+                          now + self.ttl))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            self._discard(inputs)
+            raise
+        return self.get(job_id), False
+
+    def _persist(self, job_id: str, name: str, upload: SpooledUpload) -> dict:
+        # the request's spool file is deleted when it ends; the job keeps its own copy
+        path = os.path.join(self.inputs_dir, f"{job_id}-{name}")
+        if upload.path is None:
+            with open(path, "wb") as f:
+                f.write(upload.data)
+        else:
+            try:
+                os.link(upload.path, path)
+            except OSError:  # different filesystem
+                shutil.copyfile(upload.path, path)
+        return {"filename": upload.filename, "content_type": upload.content_type, "size": upload.size,
+                "sha256": upload.sha256, "path": path}
+
+    def _discard(self, inputs: dict) -> None:
+        # with any handles a killed worker left behind (SpooledUpload.clone links next to the original)
+        for meta in inputs.values():
+            for path in glob.glob(glob.escape(meta["path"]) + "*"):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def claim(self, owner: str) -> Optional[Job]:
+        row = self._conn().execute(
+            "UPDATE jobs SET status = 'running', owner = ?, attempts = attempts + 1, updated = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1) RETURNING *",
+            (owner, time.time())).fetchone()
+        return Job.from_row(row) if row else None
+
+    def progress(self, job_id: str, fraction: float) -> None:
+        self._conn().execute("UPDATE jobs SET progress = ?, updated = ? WHERE id = ? AND status = 'running'",
+                             (fraction, time.time(), job_id))
+
+    def heartbeat(self, owner: str) -> None:
+        self._conn().execute("UPDATE jobs SET updated = ? WHERE owner = ? AND status = 'running'", (time.time(), owner))
+
+    def finish(self, job: Job, result: Optional[dict], error: Optional[str] = None, error_status: Optional[int] = None) -> None:
+        now = time.time()
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, error_status = ?, updated = ?, expires = ? "
+            "WHERE id = ?", ("failed" if error else "done", 0 if error else 1, json.dumps(result) if result is not None else None,
+                             error, error_status, now, now + self.ttl, job.id))
+        self._discard(job.inputs)
+
+    def requeue(self, stale_after: float, max_attempts: int, owner: Optional[str] = None) -> int:
+        """Puts running jobs back in the queue: those of `owner`, or any not heard from for `stale_after` seconds.
+
+        Jobs that already used `max_attempts` are failed instead, so one input
+        that kills its worker cannot take the service down in a loop.
+        """
+        conn = self._conn()
+        where, args = ("owner = ?", (owner,)) if owner else ("updated < ?", (time.time() - stale_after,))
+        rows = conn.execute(f"SELECT * FROM jobs WHERE status = 'running' AND {where}", args).fetchall()
+        for row in rows:
+            job = Job.from_row(row)
+            if job.attempts >= max_attempts:
+                self.finish(job, None, f"Gave up after {job.attempts} interrupted attempts", 500)
+            else:
+                conn.execute("UPDATE jobs SET status = 'queued', owner = NULL, progress = 0, updated = ? "
+                             "WHERE id = ? AND status = 'running'", (time.time(), job.id))
+        return len(rows)
+
+    def cleanup(self) -> int:
+        conn = self._conn()
+        rows = conn.execute("DELETE FROM jobs WHERE expires <= ? AND status != 'running' RETURNING inputs",
+                            (time.time(),)).fetchall()
+        for row in rows:
+            self._discard(json.loads(row["inputs"]))
+        return len(rows)
+
+    def counts(self) -> dict:
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+Handler = Callable[[Job, Callable[[float], Awaitable[None]]], Awaitable[Any]]
+
+class JobRunner:
+    """Claims queued jobs from the store and runs up to `concurrency` of them in this process.
+
+    `handlers` maps a job kind to `async fn(job, progress) -> result dict`; an
+    HTTPException becomes the job's error and status code. Running jobs are
+    heartbeated, and jobs whose worker stopped heartbeating are requeued, so a
+    crashed or restarted worker's jobs run again elsewhere.
+    """
+
+    def __init__(self, store: JobStore, handlers: dict[str, Handler], concurrency: int,
+                 poll_s: float = 1.0, heartbeat_s: float = 10.0, stale_s: float = 60.0, max_attempts: int = 3):
+        self.store = store
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency)
+        self.poll_s = poll_s
+        self.heartbeat_s = heartbeat_s
+        self.stale_s = stale_s
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self._loop_task: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+
+    def start(self) -> None:
+        if self._loop_task is None or self._loop_task.done():
+            self._wake = asyncio.Event()  # bind to the running loop
+            self._loop_task = asyncio.create_task(self._loop())
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    async def stop(self) -> None:
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+        for task in self._running:
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        # hand our unfinished jobs straight back instead of waiting for them to go stale
+        await run_in_threadpool(self.store.requeue, self.stale_s, self.max_attempts + 1, self.owner)
+
+    async def _loop(self) -> None:
+        last_beat = last_sweep = 0.0
+        while True:
+            now = time.monotonic()
+            if now - last_beat >= self.heartbeat_s:
+                await run_in_threadpool(self.store.heartbeat, self.owner)
+                last_beat = now
+            if now - last_sweep >= self.stale_s:
+                await run_in_threadpool(self.store.requeue, self.stale_s, self.max_attempts)
+                await run_in_threadpool(self.store.cleanup)
+                last_sweep = now
+            while len(self._running) < self.concurrency:
+                job = await run_in_threadpool(self.store.claim, self.owner)
+                if job is None:
+                    break
+                task = asyncio.create_task(self._run(job))
+                self._running.add(task)
+                task.add_done_callback(self._done)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_s)
+            except asyncio.TimeoutError:
+                pass
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        self._wake.set()  # a slot opened up
+
+    async def _run(self, job: Job) -> None:
+        async def progress(fraction: float) -> None:
+            await run_in_threadpool(self.store.progress, job.id, round(min(1.0, max(0.0, fraction)), 4))
+
+        try:
+            result = await self.handlers[job.kind](job, progress)
+        except asyncio.CancelledError:
+            raise  # shutting down; stop() requeues it
+        except HTTPException as e:
+            await run_in_threadpool(self.store.finish, job, None, str(e.detail), e.status_code)
+        except Exception:
+            log.exception("job %s (%s) failed", job.id, job.kind)
+            await run_in_threadpool(self.store.finish, job, None, "Internal error", 500)
+        else:
+            await run_in_threadpool(self.store.finish, job, result)
+
+    def state(self) -> dict:
+        return {"owner": self.owner, "running_here": len(self._running), "concurrency": self.concurrency}
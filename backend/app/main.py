@@ -1,62 +1,333 @@
-import os, io, time, re, base64
+import os, time, json, asyncio, hashlib, logging, tempfile
+from concurrent.futures import BrokenExecutor
+from functools import cache
+from contextlib import aclosing, asynccontextmanager
 from typing import Optional, List
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security.api_key import APIKeyHeader
-from starlette.responses import JSONResponse
-from starlette.requests import Request
-from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.requests import ClientDisconnect, Request
+from pydantic import BaseModel, Field, ValidationError
 from dotenv import load_dotenv
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
-import fitz  # PyMuPDF
-from PIL import Image
-import numpy as np
-import cv2
 import httpx
 
+from . import processing
+from .admission import AdmissionMiddleware, Gate, GatedStreamingResponse, parse_limits
+from .batch import BodySpool, BodyTooLarge, DuplexStreamingResponse, RecordError, iter_records
+from .blobs import BlobStore
+from .cache import ResultCache
+from .deadline import DeadlineMiddleware
+from .jobs import Job, JobRunner, JobStore
+from . import metrics
+from .metrics import MetricsMiddleware
+from .pool import WorkerPool
+from .quotas import CostQuotas, parse_quotas, parse_weights
+from .resumable import ResumableUploads
+from . import ratelimit  # noqa: F401  registers the sqlite:// limiter storage
+from .rules import RuleSet
+from .singleflight import SingleFlight
+from .transcription import TranscriptionBackend, WhisperBackend, load_backend
+from .uploads import BodyLimitMiddleware, SpooledUpload, read_upload
+from .vad import Segment, Segmenter
+
+log = logging.getLogger("amorai.api")
+
 load_dotenv()
 API_KEY = os.getenv("API_KEY", "")
+# more clients, each with its own key and quota: "name:key,name:key" (API_KEY is the one named "default")
+API_KEYS = dict(p.strip().split(":", 1) for p in os.getenv("API_KEYS", "").split(",") if p.strip())
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 origins = os.getenv("CORS_ALLOW_ORIGINS", "*").split(",")
+RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "1") == "1"  # 0 for load tests only
+# memory:// is per worker; sqlite:///rel.db (relative) or sqlite:////abs.db (absolute) shares across workers
+RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "memory://")
+# the analysis endpoints draw on a per-client budget of cost units instead of a flat request rate
+COST_WEIGHTS = {"request": 1, "page": 1, "megapixel": 1, "audio_second": 0.1} | parse_weights(os.getenv("COST_WEIGHTS", ""))
+COST_QUOTAS = parse_quotas(os.getenv("COST_QUOTAS", ""))  # "name=6000/hour,..." by API_KEYS name
+COST_QUOTA_DEFAULT = os.getenv("COST_QUOTA_DEFAULT", "3000/hour")
+COST_AUDIO_BYTES_PER_S = int(os.getenv("COST_AUDIO_BYTES_PER_S", "16000"))  # length estimate for non-WAV audio (128 kbps)
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+WORKER_POOL_KIND = os.getenv("WORKER_POOL_KIND", "process")  # process|thread
+WORKER_TASK_TIMEOUT_S = float(os.getenv("WORKER_TASK_TIMEOUT_S", "60"))
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", "300"))  # budget when the client sends no X-Request-Timeout
+REQUEST_TIMEOUT_MAX_S = float(os.getenv("REQUEST_TIMEOUT_MAX_S", "900"))
+# per endpoint "name=concurrency:queue"; entries override the defaults below
+ADMISSION_LIMITS = {
+    "ocr": (WORKER_POOL_SIZE * 2, WORKER_POOL_SIZE * 8), "imaging": (WORKER_POOL_SIZE * 2, WORKER_POOL_SIZE * 8),
+    "asr": (16, 64), "analyze": (WORKER_POOL_SIZE, WORKER_POOL_SIZE * 4),
+} | parse_limits(os.getenv("ADMISSION_LIMITS", ""))
+ADMISSION_MAX_WAIT_S = float(os.getenv("ADMISSION_MAX_WAIT_S", "30"))
+READY_MAX_POOL_QUEUE = int(os.getenv("READY_MAX_POOL_QUEUE", str(WORKER_POOL_SIZE * 8)))  # /ready says 503 beyond this backlog
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "1") == "1"
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "20"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "10"))
+UPSTREAM_KEEPALIVE_EXPIRY_S = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY_S", "30"))
+UPSTREAM_CONNECT_TIMEOUT_S = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_S", "5"))
+UPSTREAM_READ_TIMEOUT_S = float(os.getenv("UPSTREAM_READ_TIMEOUT_S", "120"))
+UPSTREAM_WRITE_TIMEOUT_S = float(os.getenv("UPSTREAM_WRITE_TIMEOUT_S", "30"))
+UPSTREAM_POOL_TIMEOUT_S = float(os.getenv("UPSTREAM_POOL_TIMEOUT_S", "10"))
+OCR_MAX_BYTES = int(os.getenv("OCR_MAX_BYTES", "25000000"))
+IMAGING_MAX_BYTES = int(os.getenv("IMAGING_MAX_BYTES", "10000000"))
+ASR_MAX_BYTES = int(os.getenv("ASR_MAX_BYTES", "25000000"))  # Whisper's own upload cap
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", "1000000"))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+OCR_CACHE_ITEMS = int(os.getenv("OCR_CACHE_ITEMS", "256"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(64 << 20)))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR") or None  # unset: memory tier only
+OCR_CACHE_DISK_MAX_BYTES = int(os.getenv("OCR_CACHE_DISK_MAX_BYTES", str(512 << 20)))
+OCR_FALLBACK = os.getenv("OCR_FALLBACK", "1") == "1"  # Tesseract for pages without a text layer
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_PAGE_CACHE_ITEMS = int(os.getenv("OCR_PAGE_CACHE_ITEMS", "4096"))
+OCR_PAGE_CACHE_MAX_BYTES = int(os.getenv("OCR_PAGE_CACHE_MAX_BYTES", str(32 << 20)))
+OCR_PAGE_CACHE_DIR = os.getenv("OCR_PAGE_CACHE_DIR") or None
+OCR_PAGE_CACHE_DISK_MAX_BYTES = int(os.getenv("OCR_PAGE_CACHE_DISK_MAX_BYTES", str(256 << 20)))
+OCR_SHARD_PAGES = int(os.getenv("OCR_SHARD_PAGES", "8"))  # fewest pages worth a worker task of their own
+IMAGING_MAX_SIDE = int(os.getenv("IMAGING_MAX_SIDE", "0"))  # >0: decode larger images at reduced scale
+IMAGING_TILE_PIXELS = int(os.getenv("IMAGING_TILE_PIXELS", "16000000"))  # full-res images above this run in row bands
+IMAGING_LARGE_MAX_BYTES = int(os.getenv("IMAGING_LARGE_MAX_BYTES", "200000000"))  # larger images get 413
+IMAGING_LARGE_MAX_PIXELS = int(os.getenv("IMAGING_LARGE_MAX_PIXELS", "40000000"))  # decoded at 1/2..1/8 scale to fit this
+PREVIEW_MAX_SIDE = int(os.getenv("PREVIEW_MAX_SIDE", "1024"))
+PREVIEW_STORE_ITEMS = int(os.getenv("PREVIEW_STORE_ITEMS", "256"))
+PREVIEW_STORE_MAX_BYTES = int(os.getenv("PREVIEW_STORE_MAX_BYTES", str(128 << 20)))
+PREVIEW_STORE_DIR = os.getenv("PREVIEW_STORE_DIR") or None  # share across workers
+PREVIEW_STORE_DISK_MAX_BYTES = int(os.getenv("PREVIEW_STORE_DISK_MAX_BYTES", str(512 << 20)))
+PREVIEW_TTL_S = float(os.getenv("PREVIEW_TTL_S", "3600"))
+PREVIEW_VARIANT_ITEMS = int(os.getenv("PREVIEW_VARIANT_ITEMS", "512"))
+PREVIEW_VARIANT_MAX_BYTES = int(os.getenv("PREVIEW_VARIANT_MAX_BYTES", str(64 << 20)))
+PREVIEW_RATE = os.getenv("PREVIEW_RATE", "120/minute")  # per address: the preview URL carries no API key
+# requested sizes and qualities round up to these, so each preview has a few dozen variants at most
+PREVIEW_SIDES = sorted({side for side in (128, 256, 512) if side < PREVIEW_MAX_SIDE} | {PREVIEW_MAX_SIDE})
+PREVIEW_QUALITIES = (40, 60, 80, 95)
+TRIAGE_BATCH_RATE = os.getenv("TRIAGE_BATCH_RATE", "10/minute")
+TRIAGE_BATCH_CHUNK = int(os.getenv("TRIAGE_BATCH_CHUNK", "256"))
+TRIAGE_BATCH_MAX_RECORD_BYTES = int(os.getenv("TRIAGE_BATCH_MAX_RECORD_BYTES", str(1 << 20)))
+TRIAGE_BATCH_MAX_BYTES = int(os.getenv("TRIAGE_BATCH_MAX_BYTES", "100000000"))  # whole body, spooled to disk
+ASR_MODEL = os.getenv("ASR_MODEL", "whisper-1")
+ASR_BACKEND = os.getenv("ASR_BACKEND", "")  # "module:factory" returning a TranscriptionBackend; unset: Whisper
+ASR_CACHE_ITEMS = int(os.getenv("ASR_CACHE_ITEMS", "1024"))
+ASR_CACHE_MAX_BYTES = int(os.getenv("ASR_CACHE_MAX_BYTES", str(16 << 20)))
+ASR_CACHE_DIR = os.getenv("ASR_CACHE_DIR") or None
+ASR_CACHE_DISK_MAX_BYTES = int(os.getenv("ASR_CACHE_DISK_MAX_BYTES", str(64 << 20)))
+ASR_CACHE_TTL_S = float(os.getenv("ASR_CACHE_TTL_S", "86400"))
+ASR_STREAM_MAX_SECONDS = float(os.getenv("ASR_STREAM_MAX_SECONDS", "1800"))  # per /asr/stream connection
+ASR_STREAM_CONCURRENCY = int(os.getenv("ASR_STREAM_CONCURRENCY", "4"))  # segments in flight per connection
+ASR_STREAM_THRESHOLD_DBFS = float(os.getenv("ASR_STREAM_THRESHOLD_DBFS", "-40"))
+ASR_STREAM_SILENCE_MS = int(os.getenv("ASR_STREAM_SILENCE_MS", "500"))
+ASR_STREAM_MIN_SPEECH_MS = int(os.getenv("ASR_STREAM_MIN_SPEECH_MS", "200"))
+ASR_STREAM_MAX_SEGMENT_S = float(os.getenv("ASR_STREAM_MAX_SEGMENT_S", "30"))
+BLOB_DIR = os.getenv("BLOB_DIR") or os.path.join(tempfile.gettempdir(), "amorai-blobs")
+BLOB_MAX_BYTES = int(os.getenv("BLOB_MAX_BYTES", str(2 << 30)))
+BLOB_TTL_S = float(os.getenv("BLOB_TTL_S", "86400"))  # since last use
+UPLOADS_DIR = os.getenv("UPLOADS_DIR") or os.path.join(tempfile.gettempdir(), "amorai-uploads")
+UPLOADS_TTL_S = float(os.getenv("UPLOADS_TTL_S", "86400"))  # unfinished uploads untouched this long are dropped
+UPLOADS_MAX_BYTES = int(os.getenv("UPLOADS_MAX_BYTES", str(4 << 30)))  # declared lengths of unfinished uploads
+JOBS_DIR = os.getenv("JOBS_DIR") or os.path.join(tempfile.gettempdir(), "amorai-jobs")  # shared by all workers
+JOBS_TTL_S = float(os.getenv("JOBS_TTL_S", "86400"))
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", str(WORKER_POOL_SIZE)))  # per worker process
+JOBS_MAX_WAIT_S = float(os.getenv("JOBS_MAX_WAIT_S", "60"))  # longest GET /jobs/{id}?wait=
+JOBS_POLL_S = float(os.getenv("JOBS_POLL_S", "1"))
+JOBS_HEARTBEAT_S = float(os.getenv("JOBS_HEARTBEAT_S", "10"))
+JOBS_STALE_S = float(os.getenv("JOBS_STALE_S", "60"))  # a running job not heartbeated this long is requeued
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+
+def _pool_gauges(p: WorkerPool):
+    metrics.POOL_TASKS.set(p.pending)
+    metrics.POOL_QUEUE.set(p.queued)
+
+pool = WorkerPool(WORKER_POOL_SIZE, WORKER_TASK_TIMEOUT_S, kind=WORKER_POOL_KIND, on_change=_pool_gauges,
+                  on_cancel=lambda state: metrics.POOL_CANCELLED.labels(state).inc())
+ocr_cache = ResultCache(OCR_CACHE_ITEMS, OCR_CACHE_MAX_BYTES, OCR_CACHE_DIR, OCR_CACHE_DISK_MAX_BYTES)
+# PDF page counts by document, for cost probes; apart from ocr_cache so they neither
+# take its slots nor skew its hit ratio
+page_counts = ResultCache(4096, 1 << 20, OCR_CACHE_DIR and os.path.join(OCR_CACHE_DIR, "page-counts"),
+                          OCR_CACHE_DISK_MAX_BYTES // 64)
+# Tesseract output per (document, page, DPI), so re-uploads and new page ranges skip OCR
+ocr_page_cache = ResultCache(OCR_PAGE_CACHE_ITEMS, OCR_PAGE_CACHE_MAX_BYTES, OCR_PAGE_CACHE_DIR, OCR_PAGE_CACHE_DISK_MAX_BYTES)
+asr_cache = ResultCache(ASR_CACHE_ITEMS, ASR_CACHE_MAX_BYTES, ASR_CACHE_DIR, ASR_CACHE_DISK_MAX_BYTES, ttl=ASR_CACHE_TTL_S)
+# lossless preview masters by ID, and apart from them (so variants never evict a
+# master) the encoded variants served from them
+preview_store = ResultCache(PREVIEW_STORE_ITEMS, PREVIEW_STORE_MAX_BYTES, PREVIEW_STORE_DIR,
+                            PREVIEW_STORE_DISK_MAX_BYTES, ttl=PREVIEW_TTL_S)
+preview_variants = ResultCache(PREVIEW_VARIANT_ITEMS, PREVIEW_VARIANT_MAX_BYTES,
+                               PREVIEW_STORE_DIR and os.path.join(PREVIEW_STORE_DIR, "variants"),
+                               PREVIEW_STORE_DISK_MAX_BYTES // 4, ttl=PREVIEW_TTL_S)
+flights = SingleFlight()  # coalesces identical in-flight uploads
+job_store = JobStore(JOBS_DIR, JOBS_TTL_S)
+blobs = BlobStore(BLOB_DIR, BLOB_MAX_BYTES, BLOB_TTL_S)  # /ocr and /imaging inputs, reusable by hash
+resumable = ResumableUploads(UPLOADS_DIR, max(OCR_MAX_BYTES, IMAGING_LARGE_MAX_BYTES, ASR_MAX_BYTES), UPLOADS_TTL_S,
+                             UPLOADS_MAX_BYTES)
+gates = {name: Gate(name, limit, queue, ADMISSION_MAX_WAIT_S) for name, (limit, queue) in ADMISSION_LIMITS.items()}
+_http: httpx.AsyncClient | None = None
+_phase = "starting"  # starting | serving | draining, for /ready
+
+def http_client() -> httpx.AsyncClient:
+    # one pooled keep-alive client for every upstream call; created lazily so
+    # it also works when the app is driven without lifespan events
+    global _http
+    if _http is None or _http.is_closed:
+        _http = httpx.AsyncClient(
+            http2=UPSTREAM_HTTP2,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY_S,
+            ),
+            timeout=httpx.Timeout(
+                connect=UPSTREAM_CONNECT_TIMEOUT_S, read=UPSTREAM_READ_TIMEOUT_S,
+                write=UPSTREAM_WRITE_TIMEOUT_S, pool=UPSTREAM_POOL_TIMEOUT_S,
+            ),
+        )
+    return _http
+
+if ASR_BACKEND:
+    asr_backend: TranscriptionBackend | None = load_backend(ASR_BACKEND)
+elif OPENAI_API_KEY:
+    asr_backend = WhisperBackend(http_client, OPENAI_BASE_URL, OPENAI_API_KEY, ASR_MODEL)
+else:
+    asr_backend = None  # dev fallback below
 
-app = FastAPI(title="Agentic Health OS API", version="0.2.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _phase
+    http_client()
+    if OCR_FALLBACK and await run_in_threadpool(_ocr_engine) is None:
+        log.warning("OCR_FALLBACK is on but %s; pages without a text layer will come back empty",
+                    "pytesseract is not installed" if processing.pytesseract is None else "the tesseract binary was not found")
+    await pool.warm(processing.warm)
+    job_runner.start()
+    _phase = "serving"
+    yield
+    _phase = "draining"
+    await job_runner.stop()
+    pool.shutdown()
+    if _http is not None:
+        await _http.aclose()
+
+app = FastAPI(title="Agentic Health OS API", version="0.2.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware, allow_origins=origins, allow_credentials=True,
     allow_methods=["*"], allow_headers=["*"],
 )
+app.add_middleware(BodyLimitMiddleware, limits={
+    "/ocr": OCR_MAX_BYTES, "/imaging": IMAGING_LARGE_MAX_BYTES, "/asr": ASR_MAX_BYTES,
+    "/analyze": OCR_MAX_BYTES + IMAGING_LARGE_MAX_BYTES + ASR_MAX_BYTES,
+    "/jobs/ocr": OCR_MAX_BYTES, "/jobs/imaging": IMAGING_LARGE_MAX_BYTES, "/jobs/asr": ASR_MAX_BYTES,
+    "/jobs/analyze": OCR_MAX_BYTES + IMAGING_LARGE_MAX_BYTES + ASR_MAX_BYTES,
+})
+app.add_middleware(AdmissionMiddleware, gates={f"/{name}": gate for name, gate in gates.items()})
+app.add_middleware(DeadlineMiddleware, default=REQUEST_TIMEOUT_S, max_timeout=REQUEST_TIMEOUT_MAX_S,
+                   on_cancel=lambda scope, reason: metrics.CANCELLED.labels(metrics.endpoint(scope), reason).inc())
+app.add_middleware(MetricsMiddleware)
+
+def _client(request: Request) -> str:
+    # the API key's name once require_key has run, else the address
+    return getattr(request.state, "identity", None) or get_remote_address(request)
 
-limiter = Limiter(key_func=get_remote_address, default_limits=["60/minute"])
+limiter = Limiter(key_func=_client, default_limits=["60/minute"], storage_uri=RATELIMIT_STORAGE_URI)
+limiter.enabled = RATELIMIT_ENABLED  # slowapi reads the same variable but treats any non-empty string as true
 app.state.limiter = limiter
+quotas = CostQuotas(limiter.limiter, COST_WEIGHTS, COST_QUOTAS, COST_QUOTA_DEFAULT, RATELIMIT_ENABLED)
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+KEYS = {key: name for name, key in API_KEYS.items()} | ({API_KEY: "default"} if API_KEY else {})
 
-def require_key(key: str | None = Depends(api_key_header)):
-    if not API_KEY:  # allow local dev if not set
+def require_key(request: Request, key: str | None = Depends(api_key_header)):
+    if not KEYS:  # allow local dev if not set
+        request.state.identity = get_remote_address(request)
         return
-    if key != API_KEY:
+    if key not in KEYS:
         raise HTTPException(status_code=401, detail="Invalid API key")
+    request.state.identity = KEYS[key]
 
 @app.exception_handler(RateLimitExceeded)
 def ratelimit_handler(request: Request, exc: RateLimitExceeded):
     return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"})
 
+def _upstream_state() -> dict:
+    # httpx has no public pool stats; the httpcore pool under its transport does
+    conns = getattr(getattr(getattr(_http, "_transport", None), "_pool", None), "connections", None)
+    if _http is None or _http.is_closed or conns is None:
+        return {"open": False}
+    return {"open": True, "http2": UPSTREAM_HTTP2, "connections": len(conns), "idle": sum(c.is_idle() for c in conns),
+            "max_connections": UPSTREAM_MAX_CONNECTIONS}
+
+def _capacity() -> dict:
+    # this worker process only; each uvicorn worker answers for itself
+    blob_lookups = blobs.hits + blobs.misses
+    return {
+        "in_flight": dict(metrics.in_flight),
+        "admission": {name: gate.state() for name, gate in gates.items()},
+        "pool": pool.state(),
+        "upstream": _upstream_state(),
+        "cache_hit_ratio": {"ocr": ocr_cache.stats()["hit_ratio"], "ocr_page": ocr_page_cache.stats()["hit_ratio"],
+                            "asr": asr_cache.stats()["hit_ratio"], "preview": preview_store.stats()["hit_ratio"],
+                            "preview_variants": preview_variants.stats()["hit_ratio"],
+                            "blobs": round(blobs.hits / blob_lookups, 4) if blob_lookups else 0.0},
+        "jobs": job_runner.state(),
+        "dependencies": {"pool_warm": pool.warmed, "ocr_engine": _ocr_engine(),
+                         "asr_backend": asr_backend.name if asr_backend else None},
+    }
+
 @app.get("/health")
 @limiter.limit("20/minute")
-def health(request: Request):
-    return {"ok": True, "version": "0.2.0", "time": int(time.time())}
+def health(request: Request, verbose: bool = False):
+    out = {"ok": True, "version": "0.2.0", "time": int(time.time())}
+    if verbose:
+        out |= {"phase": _phase, **_capacity()}
+    return out
+
+@app.get("/ready")
+async def ready():
+    """For load balancers: 200 while this worker can take more work, else 503.
+
+    Not ready while starting up (before the worker pool is warm), while the
+    pool is being replaced after a worker died, while draining on shutdown,
+    when any endpoint's admission queue is full, or when the worker pool's
+    backlog exceeds READY_MAX_POOL_QUEUE. The body gives the reasons along
+    with the same capacity report as /health?verbose=1.
+    """
+    reasons = [] if _phase == "serving" else [_phase]
+    if _phase == "serving" and not pool.check():
+        reasons.append("worker pool restarting")
+    full = [gate for gate in gates.values() if gate.full]
+    reasons += [f"{gate.name} at capacity" for gate in full]
+    if pool.queued > READY_MAX_POOL_QUEUE:
+        reasons.append(f"worker pool backlog of {pool.queued}")
+    headers = {"Retry-After": str(min(gate.retry_after() for gate in full))} if full else None
+    return JSONResponse({"ready": not reasons, "reasons": reasons, **await run_in_threadpool(_capacity)},
+                        status_code=503 if reasons else 200, headers=headers)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
 
 @app.get("/secure-check", dependencies=[Depends(require_key)])
 @limiter.limit("20/minute")
 def secure_check(request: Request):
     return {"ok": True, "secure": True}
 
+@app.get("/stats", dependencies=[Depends(require_key)])
+@limiter.limit("20/minute")
+async def stats(request: Request):
+    return {"ocr_cache": ocr_cache.stats(), "ocr_page_cache": ocr_page_cache.stats(),
+            "page_counts": page_counts.stats(), "asr_cache": asr_cache.stats(),
+            "preview_store": preview_store.stats(), "preview_variants": preview_variants.stats(), "singleflight": flights.stats(), "blobs": blobs.stats(),
+            "jobs": await run_in_threadpool(job_store.counts), "quota": quotas.remaining(request.state.identity)}
+
 # ---------- Schemas ----------
 class ASRResponse(BaseModel):
     text: str
     latency_ms: int
+    cache: str = Field("miss", description="hit|miss|bypass")
 
 class OCRResponse(BaseModel):
     text: str
@@ -65,11 +336,39 @@ class OCRResponse(BaseModel):
 class ImagingMetrics(BaseModel):
     mean_intensity: float
     edge_density: float
-    blur_score: float
+    blur_score: Optional[float] = None  # None when the image was decoded at reduced scale
+    decode_scale: float = 1.0
 
 class ImagingResponse(BaseModel):
     metrics: ImagingMetrics
-    preview_b64: Optional[str] = None
+    preview_id: Optional[str] = None
+    preview_url: Optional[str] = None
+
+class UploadCreate(BaseModel):
+    filename: str
+    length: int = Field(..., gt=0, description="total bytes the upload will have")
+    content_type: Optional[str] = None
+
+class UploadStatus(BaseModel):
+    id: str
+    filename: str
+    content_type: Optional[str] = None
+    length: int
+    offset: int = Field(..., description="bytes received; the next PATCH starts here")
+    sha256: Optional[str] = Field(None, description="set once finalized")
+
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    status: str = Field(..., description="queued|running|done|failed")
+    progress: float = Field(..., description="0..1")
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    error_status: Optional[int] = None
+    attempts: int
+    created: float
+    updated: float
+    duplicate: bool = Field(False, description="an identical live job already existed; this is that job")
 
 class TriageInput(BaseModel):
     transcript_text: Optional[str] = None
@@ -84,40 +383,98 @@ class TriageResult(BaseModel):
     evidence: dict
 
 # ---------- Helpers ----------
-def _imaging_metrics(img: Image.Image) -> ImagingMetrics:
-    arr = np.array(img.convert("L"))
-    mean_int = float(arr.mean()/255.0)
-    edges = cv2.Canny(arr, 50, 150)
-    edge_density = float(edges.mean()/255.0)
-    blur = float(cv2.Laplacian(arr, cv2.CV_64F).var())
-    blur_score = float(min(1.0, max(0.0, 1.0 - (blur/200.0))))
-    return ImagingMetrics(mean_intensity=mean_int, edge_density=edge_density, blur_score=blur_score)
+RULES = RuleSet()
+
+async def _read(file: UploadFile, limit: int, detail: str) -> SpooledUpload:
+    with metrics.timed("upload_read"):
+        return await read_upload(file, limit, UPLOAD_SPOOL_THRESHOLD, UPLOAD_SPOOL_DIR, detail)
+
+async def _input(request: Request, file: UploadFile | None, sha256: str | None, upload_id: str | None, limit: int,
+                 detail: str, pdf: bool = False, keep: bool = True) -> SpooledUpload:
+    # a fresh upload (kept in the blob store for next time if `keep`), a blob
+    # sent earlier, or a finished resumable upload, which is one of those blobs;
+    # blobs are looked up only among those this identity uploaded itself
+    if file is not None:
+        if pdf and not (file.filename or "").lower().endswith(".pdf"):
+            raise HTTPException(400, "Upload a PDF")
+        upload = await _read(file, limit, detail)
+        if keep:
+            try:
+                await blobs.aput(upload, request.state.identity)
+            except OSError:
+                pass  # a full blob disk only costs the client a re-send next time
+        return upload
+    if upload_id:
+        sha256 = (await run_in_threadpool(resumable.get, upload_id))["sha256"]
+        if sha256 is None:
+            raise HTTPException(409, "Upload not finalized")
+    if not sha256:
+        raise HTTPException(422, "Send a file, the sha256 of one sent before, or an upload_id")
+    upload = await blobs.aget(sha256.lower(), request.state.identity)
+    if upload is None:
+        raise HTTPException(404, "Upload expired; send it again" if upload_id else "No blob with that sha256; send the file itself")
+    if upload.size > limit:
+        upload.close()
+        raise HTTPException(413, detail)
+    if pdf and not upload.filename.lower().endswith(".pdf"):
+        upload.close()
+        raise HTTPException(400, "Upload a PDF")
+    return upload
+
+async def _offload(fn, *args):
+    try:
+        value, timings = await pool.run(fn, *args)
+        for stage, seconds in timings:
+            metrics.observe(stage, seconds)
+        return value
+    except asyncio.TimeoutError:
+        raise HTTPException(504, "Processing timed out")
+    except BrokenExecutor:  # a worker died mid-task; the pool has already been replaced
+        raise HTTPException(503, "Worker process crashed; try again", headers={"Retry-After": "1"})
+    except ValueError as e:  # processing's way of saying the input is unusable
+        raise HTTPException(422, str(e))
+
+async def _page_count(upload: SpooledUpload) -> int:
+    # content-addressed, so a document is opened for its page count at most once
+    cached = await page_counts.aget(upload.sha256)
+    if cached is not None:
+        return int(cached)
+    total = await _offload(processing.pdf_page_count, upload.source)
+    await page_counts.aput(upload.sha256, str(total).encode())
+    return total
+
+async def _charge(request: Request, uploads: dict[str, SpooledUpload], pages: str | None = None) -> None:
+    # the cost comes from probing the inputs (page count, image header, audio
+    # length) before any real work, so a cached result costs the same as a fresh one.
+    # Called once admitted, so a request the gate turns away spends nothing
+    if not quotas.enabled:
+        return
+    units = {"request": 1}
+    for stage, upload in uploads.items():
+        if stage == "ocr":
+            total = await _page_count(upload)
+            try:
+                units["page"] = len(processing.parse_pages(pages, total))
+            except ValueError as e:
+                raise HTTPException(422, str(e))
+        elif stage == "imaging":
+            units["megapixel"] = await _offload(processing.image_pixels, upload.source) / 1e6
+        else:
+            units["audio_second"] = await _offload(processing.audio_seconds, upload.source, upload.size, COST_AUDIO_BYTES_PER_S)
+    quotas.charge(request.state.identity, units)
 
 def rule_engine(inp: TriageInput) -> TriageResult:
-    alerts, next_steps, ev = [], [], {}
+    next_steps = []
     txt = f"{inp.transcript_text or ''}\n{inp.lab_text or ''}".lower()
-
-    if re.search(r"chest pain|pressure|tightness", txt):
-        alerts.append("Possible cardiac chest pain")
-    if re.search(r"shortness of breath|dyspnea", txt):
-        alerts.append("Respiratory distress")
-    m = re.search(r"oxygen[^0-9]*([0-9]{2})", txt)
-    if m:
-        spo2 = int(m.group(1))
-        ev["spo2"] = spo2
-        if spo2 < 92:
-            alerts.append("Low SpO₂")
+    with metrics.timed("rule_eval"):
+        alerts, score, ev = RULES.evaluate(txt)
     if inp.imaging:
         ev["imaging"] = inp.imaging.dict()
-        if inp.imaging.blur_score > 0.8:
+        if inp.imaging.blur_score is not None and inp.imaging.blur_score > 0.8:
             next_steps.append("Re-acquire image. Excessive blur.")
         if inp.imaging.edge_density < 0.03:
             next_steps.append("Underexposed image. Increase exposure.")
 
-    score = 0
-    score += 2 if any(k in txt for k in ["chest pain", "faint", "collapse"]) else 0
-    score += 2 if "respiratory distress" in alerts else 0
-    score += 2 if "low spo₂" in [a.lower() for a in alerts] else 0
     risk = "LOW" if score <= 1 else "MODERATE" if score == 2 else "HIGH" if score == 3 else "EMERGENCY"
 
     if risk in ["HIGH","EMERGENCY"]:
@@ -132,62 +489,629 @@ def rule_engine(inp: TriageInput) -> TriageResult:
         evidence=ev
     )
 
+# ---------- Stages ----------
+# Shared by the single-purpose endpoints and /analyze. Callers own the upload and close it.
+def _shared(key: tuple, upload: SpooledUpload, stage):
+    # identical concurrent requests share one computation; it runs on its own
+    # handle to the upload, so it survives the request that started it leaving
+    async def run(own: SpooledUpload):
+        try:
+            return await stage(own)
+        finally:
+            own.close()
+    return flights.do(key, lambda: run(upload.clone()))
+
+async def _transcribe(upload: SpooledUpload) -> ASRResponse:
+    started = time.time()
+    if asr_backend is None:
+        # dev fallback: pretend transcription
+        return ASRResponse(text="(dev) transcription unavailable without OPENAI_API_KEY", latency_ms=int((time.time()-started)*1000), cache="bypass")
+    text, cache_state = await _shared(("asr", asr_backend.name, upload.sha256), upload, _recognize)
+    return ASRResponse(text=text, latency_ms=int((time.time()-started)*1000), cache=cache_state)
+
+async def _recognize(upload: SpooledUpload) -> tuple[str, str]:
+    key = f"asr:{asr_backend.name}:{upload.sha256}"
+    cached = await asr_cache.aget(key)
+    if cached is not None:
+        return cached.decode(), "hit"
+    text = await asr_backend.transcribe(upload)
+    await asr_cache.aput(key, text.encode())
+    return text, "miss"
+
+def _shards(pages: list[int], stream: bool = False) -> list[list[int]]:
+    # contiguous runs, at most one per worker, none shorter than OCR_SHARD_PAGES;
+    # streamed, OCR_SHARD_PAGES each so the first pages go out as soon as they are read
+    size = OCR_SHARD_PAGES if stream else max(OCR_SHARD_PAGES, -(-len(pages) // pool.size))
+    return [pages[i:i + size] for i in range(0, len(pages), size)]
+
+@cache
+def _ocr_engine() -> str | None:
+    # part of every OCR cache key; None when the fallback is off or Tesseract is missing
+    version = processing.tesseract_version() if OCR_FALLBACK else None
+    return f"tesseract-{version}-{OCR_LANG}-{OCR_DPI}" if version else None
+
+async def _ocr_page(upload: SpooledUpload, page: int, engine: str) -> str:
+    key = f"ocrpage:{engine}:{upload.sha256}:{page}"
+    cached = await ocr_page_cache.aget(key)
+    if cached is not None:
+        return cached.decode()
+    text = await _offload(processing.ocr_page, upload.source, page, OCR_DPI, OCR_LANG)
+    await ocr_page_cache.aput(key, text.encode())
+    return text
+
+async def _extract_shard(upload: SpooledUpload, pages: list[int]) -> list[tuple[int, str]]:
+    # text layer first; pages that come back blank are OCRed, one pool task each
+    shard = await _offload(processing.pdf_pages, upload.source, pages)
+    engine = _ocr_engine()
+    blank = [i for i, (_, text) in enumerate(shard) if not text.strip()] if engine else []
+    if blank:
+        texts = await asyncio.gather(*(_ocr_page(upload, shard[i][0], engine) for i in blank))
+        for i, text in zip(blank, texts):
+            shard[i] = (shard[i][0], text)
+    return shard
+
+async def _pdf_pages(upload: SpooledUpload, pages: str | None, stream: bool = False):
+    """Yields (document page count, [(page, text), ...]) shard by shard, in page order.
+
+    Shards are extracted concurrently across the pool, with Tesseract filling
+    in pages that have no text layer; the full selection is cached once the
+    last shard has been yielded. With `stream`, shards are OCR_SHARD_PAGES long
+    rather than one per worker.
+    """
+    spec = (pages or "").replace(" ", "") or "all"
+    key = f"ocr:{processing.PDF_EXTRACTOR_VERSION}:{_ocr_engine() or 'text'}:{upload.sha256}:{spec}"
+    cached = await ocr_cache.aget(key)
+    if cached is not None:
+        hit = json.loads(cached)
+        yield hit["pages"], [tuple(item) for item in hit["items"]]
+        return
+    total = await _page_count(upload)
+    try:
+        selected = processing.parse_pages(pages, total)
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    if not selected:  # an empty document
+        yield total, []
+        return
+    tasks = [asyncio.create_task(_extract_shard(upload, shard)) for shard in _shards(selected, stream)]
+    items = []
+    try:
+        for task in tasks:
+            shard = await task
+            items += shard
+            yield total, shard
+    finally:
+        for task in tasks:
+            if not task.cancel() and not task.cancelled():
+                task.exception()  # already finished; mark any error as retrieved
+    await ocr_cache.aput(key, json.dumps({"pages": total, "items": items}).encode())
+
+async def _extract_pdf(upload: SpooledUpload, pages: str | None = None) -> OCRResponse:
+    async def collect(own: SpooledUpload) -> OCRResponse:
+        total, chunks = 0, []
+        async for total, shard in _pdf_pages(own, pages):
+            chunks += [text for _, text in shard]
+        return OCRResponse(text="\n".join(chunks).strip(), pages=total)
+    return await _shared(("ocr", upload.sha256, (pages or "").replace(" ", "")), upload, collect)
+
+async def _analyze_image(upload: SpooledUpload, preview: bool) -> ImagingResponse:
+    async def analyze(own: SpooledUpload) -> tuple[dict, str | None]:
+        # uploads over IMAGING_MAX_BYTES are decoded at reduced scale instead of refused
+        metrics, master = await _offload(processing.imaging, own.source, preview, PREVIEW_MAX_SIDE,
+                                         IMAGING_MAX_SIDE, IMAGING_TILE_PIXELS,
+                                         IMAGING_LARGE_MAX_PIXELS if own.size > IMAGING_MAX_BYTES else 0)
+        if master is None:
+            return metrics, None
+        # content-addressed, so re-uploads of the same image reuse one ID
+        preview_id = f"{own.sha256[:40]}-{PREVIEW_MAX_SIDE}"
+        await preview_store.aput(f"master:{preview_id}", master)
+        return metrics, preview_id
+    metrics, preview_id = await _shared(("imaging", upload.sha256, preview), upload, analyze)
+    return ImagingResponse(metrics=ImagingMetrics(**metrics), preview_id=preview_id)
+
+def _with_preview_url(request: Request, out: ImagingResponse) -> ImagingResponse:
+    if out.preview_id is not None:
+        out.preview_url = str(request.url_for("imaging_preview", preview_id=out.preview_id))
+    return out
+
+async def _stages(uploads: dict[str, SpooledUpload], preview: bool):
+    """Runs the stage for each of `uploads` concurrently, yielding (stage, result or HTTPException) as each finishes."""
+    stages = {"asr": _transcribe, "ocr": _extract_pdf, "imaging": lambda u: _analyze_image(u, preview)}
+    tasks = {asyncio.create_task(stages[name](u)): name for name, u in uploads.items()}
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                exc = task.exception()
+                if exc is None:
+                    yield tasks[task], task.result()
+                elif isinstance(exc, HTTPException):
+                    yield tasks[task], exc
+                else:
+                    log.error("%s stage failed", tasks[task], exc_info=exc)
+                    yield tasks[task], HTTPException(500, "Internal error")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def _verdict(results: dict) -> TriageResult:
+    return rule_engine(TriageInput(
+        transcript_text=results["asr"].text if "asr" in results else None,
+        lab_text=results["ocr"].text if "ocr" in results else None,
+        imaging=results["imaging"].metrics if "imaging" in results else None,
+    ))
+
 # ---------- Endpoints ----------
 @app.post("/asr", dependencies=[Depends(require_key)], response_model=ASRResponse)
-@limiter.limit("20/minute")
-async def asr(request: Request, file: UploadFile = File(...)):
-    if not OPENAI_API_KEY:
-        # dev fallback: pretend transcription
-        started = time.time()
-        return ASRResponse(text="(dev) transcription unavailable without OPENAI_API_KEY", latency_ms=int((time.time()-started)*1000))
-    audio = await file.read()
-    started = time.time()
-    async with httpx.AsyncClient(timeout=120) as client:
-        r = await client.post(
-            "https://api.openai.com/v1/audio/transcriptions",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
-            files={"file": (file.filename, audio, file.content_type or "audio/mpeg")},
-            data={"model":"whisper-1"}
-        )
-    if r.status_code != 200:
-        raise HTTPException(r.status_code, r.text)
-    text = r.json().get("text","")
-    return ASRResponse(text=text, latency_ms=int((time.time()-started)*1000))
+async def asr(request: Request, file: Optional[UploadFile] = File(None), upload_id: Optional[str] = Query(None)):
+    upload = await _input(request, file, None, upload_id, ASR_MAX_BYTES, "Audio too large", keep=False)
+    try:
+        async with gates["asr"].slot():
+            await _charge(request, {"asr": upload})
+            return await _transcribe(upload)
+    finally:
+        upload.close()
+
+@app.websocket("/asr/stream")
+async def asr_stream(ws: WebSocket, sample_rate: int = Query(16000, ge=8000, le=48000)):
+    """Transcribes live audio: binary frames of 16-bit little-endian mono PCM at `sample_rate`.
+
+    Speech is cut into segments on silence and each segment is transcribed as
+    soon as it closes, several at a time, while audio keeps arriving. Events
+    are JSON text frames: `ready`; `segment` {index, start, end, text} as each
+    one is transcribed (not necessarily in order); `error` {index, status,
+    detail} for a segment that failed; and after the client sends
+    {"type": "end"}, `final` {text, segments, latency_ms}, the segments in
+    order, before the server closes. The API key goes in X-API-Key or, for
+    browsers, the `api_key` query parameter. Each segment is charged to the
+    key's cost quota as it closes; one the quota cannot cover gets an `error`
+    with status 429.
+    """
+    key = ws.headers.get("x-api-key") or ws.query_params.get("api_key")
+    if KEYS and key not in KEYS:
+        await ws.close(1008, "Invalid API key")
+        return
+    identity = KEYS[key] if KEYS else (ws.client.host if ws.client else "127.0.0.1")
+    try:
+        quotas.charge(identity, {"request": 1})
+    except HTTPException as e:
+        await ws.close(1013, e.detail)
+        return
+    await ws.accept()
+    segmenter = Segmenter(sample_rate, threshold_dbfs=ASR_STREAM_THRESHOLD_DBFS, silence_ms=ASR_STREAM_SILENCE_MS,
+                          min_speech_ms=ASR_STREAM_MIN_SPEECH_MS, max_segment_s=ASR_STREAM_MAX_SEGMENT_S)
+    texts: dict[int, str] = {}
+    tasks: set[asyncio.Task] = set()
+    sending = asyncio.Lock()
+    in_flight = asyncio.Semaphore(ASR_STREAM_CONCURRENCY)
+
+    async def send(event: dict):
+        async with sending:
+            await ws.send_json(event)
+
+    async def transcribe(seg: Segment):
+        wav = seg.wav(sample_rate)
+        upload = SpooledUpload(f"segment-{seg.index}.wav", "audio/wav", len(wav), hashlib.sha256(wav).hexdigest(), data=wav)
+        try:
+            quotas.charge(identity, {"audio_second": seg.end - seg.start})
+            async with in_flight, gates["asr"].slot():
+                res = await _transcribe(upload)
+        except HTTPException as e:
+            await send({"type": "error", "index": seg.index, "status": e.status_code, "detail": e.detail})
+            return
+        texts[seg.index] = res.text
+        await send({"type": "segment", "index": seg.index, "start": round(seg.start, 3), "end": round(seg.end, 3),
+                    "text": res.text, "cache": res.cache})
+
+    def start(segments: list[Segment]):
+        for seg in segments:
+            task = asyncio.create_task(transcribe(seg))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    received, limit = 0, int(ASR_STREAM_MAX_SECONDS * sample_rate * 2)
+    try:
+        await send({"type": "ready", "sample_rate": sample_rate})
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                received += len(message["bytes"])
+                if received > limit:
+                    await ws.close(1009, f"Stream longer than {ASR_STREAM_MAX_SECONDS:g}s")
+                    return
+                start(segmenter.feed(message["bytes"]))
+            elif message.get("text"):
+                try:
+                    end = json.loads(message["text"]).get("type") == "end"
+                except (ValueError, AttributeError):
+                    end = False
+                if end:
+                    break
+        start(segmenter.flush())
+        ended = time.monotonic()
+        await asyncio.gather(*tasks)
+        await send({"type": "final", "text": " ".join(texts[i] for i in sorted(texts) if texts[i]).strip(),
+                    "segments": len(texts), "latency_ms": int((time.monotonic() - ended) * 1000)})
+        await ws.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
 
 @app.post("/ocr", dependencies=[Depends(require_key)], response_model=OCRResponse)
-@limiter.limit("20/minute")
-async def ocr(request: Request, file: UploadFile = File(...)):
-    if not file.filename.lower().endswith(".pdf"):
-        raise HTTPException(400, "Upload a PDF")
-    data = await file.read()
-    if len(data) > 25_000_000:
-        raise HTTPException(413, "PDF too large")
-    doc = fitz.open(stream=data, filetype="pdf")
-    pages = len(doc)
-    chunks = [p.get_text() for p in doc]
-    return OCRResponse(text="\n".join(chunks).strip(), pages=pages)
+async def ocr(request: Request, file: Optional[UploadFile] = File(None), sha256: Optional[str] = Query(None),
+              upload_id: Optional[str] = Query(None), pages: Optional[str] = Form(None), stream: bool = Form(False)):
+    """Extracts text from a PDF, optionally only `pages` (1-based, e.g. "1-3,7,10-").
+
+    Instead of the file, `?sha256=` names one sent before (see HEAD /blobs/{sha256})
+    and `?upload_id=` a finished resumable upload (see POST /uploads).
+    `pages` in the response is the document's page count. With `stream=true`
+    the response is NDJSON, one `{"page", "text"}` line per page in page order
+    as extraction proceeds; a failure mid-stream ends it with an `{"error"}` line.
+    """
+    upload = await _input(request, file, sha256, upload_id, OCR_MAX_BYTES, "PDF too large", pdf=True)
+    if not stream:
+        try:
+            async with gates["ocr"].slot():
+                await _charge(request, {"ocr": upload}, pages)
+                return await _extract_pdf(upload, pages)
+        finally:
+            upload.close()
+
+    shards = _pdf_pages(upload, pages, stream=True)
+    admitted_at = None
+    try:
+        admitted_at = await gates["ocr"].acquire()
+        await _charge(request, {"ocr": upload}, pages)
+        first = await anext(shards)  # bad input still gets a proper status code
+    except BaseException:
+        if admitted_at is not None:
+            gates["ocr"].release(admitted_at)
+        await shards.aclose()
+        upload.close()
+        raise
+
+    async def lines():
+        try:
+            shard = first[1]
+            while True:
+                yield "".join(json.dumps({"page": n, "text": text}, ensure_ascii=False) + "\n" for n, text in shard)
+                try:
+                    shard = (await anext(shards))[1]
+                except StopAsyncIteration:
+                    break
+        except HTTPException as e:
+            yield json.dumps({"error": e.detail, "status": e.status_code}) + "\n"
+        finally:
+            await shards.aclose()
+            upload.close()
+
+    return GatedStreamingResponse(lines(), gates["ocr"], admitted_at, media_type="application/x-ndjson")
 
 @app.post("/imaging", dependencies=[Depends(require_key)], response_model=ImagingResponse)
+async def imaging(request: Request, file: Optional[UploadFile] = File(None), sha256: Optional[str] = Query(None),
+                  upload_id: Optional[str] = Query(None), preview: bool = Form(False)):
+    upload = await _input(request, file, sha256, upload_id, IMAGING_LARGE_MAX_BYTES, "Image too large")
+    try:
+        async with gates["imaging"].slot():
+            await _charge(request, {"imaging": upload})
+            return _with_preview_url(request, await _analyze_image(upload, preview))
+    finally:
+        upload.close()
+
+@app.api_route("/blobs/{sha256}", methods=["GET", "HEAD"], dependencies=[Depends(require_key)])
+@limiter.limit("120/minute")
+async def blob(request: Request, sha256: str):
+    """Whether the server still holds a file, so a client can send `?sha256=` instead of the bytes.
+
+    200 with its size, filename and content type, or 404, also for files only
+    other API keys have sent. A hit also keeps the blob from being evicted for a while.
+    """
+    meta = await blobs.ahead(sha256.lower(), request.state.identity)
+    if meta is None:
+        raise HTTPException(404, "Not stored")
+    return JSONResponse({"sha256": sha256.lower(), **meta}, headers={"X-Blob-Size": str(meta["size"])})
+
+# ---------- Resumable uploads ----------
+def _upload_status(meta: dict) -> UploadStatus:
+    return UploadStatus(**{k: meta[k] for k in UploadStatus.model_fields})
+
+@app.post("/uploads", dependencies=[Depends(require_key)], status_code=201, response_model=UploadStatus)
 @limiter.limit("20/minute")
-async def imaging(request: Request, file: UploadFile = File(...), preview: bool = Form(False)):
-    data = await file.read()
-    if len(data) > 10_000_000:
-        raise HTTPException(413, "Image too large")
-    img = Image.open(io.BytesIO(data))
-    metrics = _imaging_metrics(img)
-    out = ImagingResponse(metrics=metrics)
-    if preview:
-        arr = np.array(img.convert("RGB"))
-        gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-        edges = cv2.Canny(gray, 50, 150)
-        overlay = arr.copy()
-        overlay[edges>0] = [255,0,0]
-        blend = cv2.addWeighted(arr, 0.8, overlay, 0.2, 0)
-        _, buf = cv2.imencode(".jpg", blend)
-        out.preview_b64 = "data:image/jpeg;base64," + base64.b64encode(buf.tobytes()).decode()
-    return out
+async def create_upload(request: Request, body: UploadCreate):
+    """Starts a resumable upload: PATCH the bytes to its Location in as many pieces as needed,
+    each with `Upload-Offset` set to the bytes already received (HEAD reports it after a
+    dropped connection), then POST .../finalize and pass the ID as `?upload_id=`."""
+    meta = await run_in_threadpool(resumable.create, body.length, body.filename, body.content_type)
+    return JSONResponse(_upload_status(meta).model_dump(), status_code=201,
+                        headers={"Location": str(request.url_for("upload", upload_id=meta["id"]))})
 
-@app.post("/triage", dependencies=[Depends(require_key)], response_model=TriageResult)
+@app.api_route("/uploads/{upload_id}", methods=["GET", "HEAD"], name="upload", dependencies=[Depends(require_key)],
+               response_model=UploadStatus)
+@limiter.limit("120/minute")
+async def upload(request: Request, upload_id: str):
+    meta = await run_in_threadpool(resumable.get, upload_id)
+    return JSONResponse(_upload_status(meta).model_dump(), headers={
+        "Upload-Offset": str(meta["offset"]), "Upload-Length": str(meta["length"]), "Cache-Control": "no-store"})
+
+@app.patch("/uploads/{upload_id}", dependencies=[Depends(require_key)], status_code=204)
+@limiter.limit("600/minute")
+async def patch_upload(request: Request, upload_id: str):
+    try:
+        offset = int(request.headers["upload-offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(400, "Upload-Offset header required")
+    try:
+        offset = await resumable.append(upload_id, offset, request.stream())
+    except ClientDisconnect:  # what arrived is kept; the client resumes from HEAD's offset
+        return Response(status_code=499)
+    return Response(status_code=204, headers={"Upload-Offset": str(offset)})
+
+@app.post("/uploads/{upload_id}/finalize", dependencies=[Depends(require_key)], response_model=UploadStatus)
 @limiter.limit("20/minute")
+async def finalize_upload(request: Request, upload_id: str):
+    return _upload_status(await run_in_threadpool(resumable.finalize, upload_id, blobs, request.state.identity))
+
+def _snap(value: int, steps) -> int:
+    return next((step for step in steps if step >= value), steps[-1])
+
+@app.get("/imaging/preview/{preview_id}", name="imaging_preview")
+@limiter.limit(PREVIEW_RATE)
+async def imaging_preview(request: Request, preview_id: str,
+                          max_side: int = Query(PREVIEW_MAX_SIDE, ge=16, le=PREVIEW_MAX_SIDE),
+                          format: str = Query("webp", pattern="^(jpeg|webp|png)$"),
+                          quality: int = Query(80, ge=1, le=100)):
+    # no API key: <img> tags cannot send headers, and the ID is a hash of an image the caller already holds
+    max_side = _snap(max_side, PREVIEW_SIDES)
+    quality = 0 if format == "png" else _snap(quality, PREVIEW_QUALITIES)  # PNG is lossless
+    variant = f"{preview_id}:{max_side}:{format}:{quality}"
+    etag = f'"{variant}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(PREVIEW_TTL_S)}, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    media_type = processing.PREVIEW_FORMATS[format][2]
+    body = await preview_variants.aget(variant)
+    if body is None:
+        master = await preview_store.aget(f"master:{preview_id}")
+        if master is None:
+            raise HTTPException(404, "Preview not found or expired")
+        body = await _offload(processing.render_preview, master, max_side, format, quality)
+        await preview_variants.aput(variant, body)
+    return Response(body, media_type=media_type, headers=headers)
+
+@app.post("/triage", dependencies=[Depends(require_key)], response_model=TriageResult)
 async def triage(request: Request, payload: TriageInput):
+    await _charge(request, {})
     return rule_engine(payload)
+
+def _score_chunk(chunk: list) -> str:
+    out = []
+    for index, record in chunk:
+        if isinstance(record, RecordError):
+            out.append({"index": index, "error": str(record)})
+            continue
+        try:
+            out.append({"index": index, "result": rule_engine(TriageInput.model_validate(record)).model_dump()})
+        except ValidationError as e:
+            err = e.errors()[0]
+            out.append({"index": index, "error": f"{'.'.join(map(str, err['loc'])) or 'record'}: {err['msg']}"})
+    return "".join(json.dumps(o, ensure_ascii=False) + "\n" for o in out)
+
+@app.post("/triage/batch", dependencies=[Depends(require_key)])
+@limiter.limit(TRIAGE_BATCH_RATE)
+async def triage_batch(request: Request):
+    """Scores NDJSON or a JSON array of TriageInput records, streaming one NDJSON line per record.
+
+    Lines are `{"index", "result"}` or `{"index", "error"}`; records are read,
+    scored and written in chunks so memory stays flat however large the batch.
+    The body is spooled to disk as it arrives, so clients may send all of it
+    before reading any of the response. Each record costs what one /triage call
+    does, charged a chunk at a time; once the quota runs out the stream ends
+    with a fatal `{"index", "error", "status": 429}` line at the first unscored record.
+    Bodies over TRIAGE_BATCH_MAX_BYTES get 413 when declared up front; sent
+    chunked, they end with a fatal `"status": 413` line after what fit.
+    """
+    # not in BodyLimitMiddleware: past the limit it can only cut a streaming response
+    # short, so BodySpool enforces it instead and the stream ends with a fatal line
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > TRIAGE_BATCH_MAX_BYTES:
+        raise HTTPException(413, f"Batch exceeds {TRIAGE_BATCH_MAX_BYTES} bytes")
+
+    def score(chunk: list) -> str:
+        quotas.charge(request.state.identity, {"request": len(chunk)})
+        return _score_chunk(chunk)
+
+    async def lines():
+        chunk, index = [], 0
+        try:
+            try:
+                async with BodySpool(request.receive, UPLOAD_SPOOL_DIR, TRIAGE_BATCH_MAX_BYTES) as spool:
+                    async for record in iter_records(spool.chunks(), TRIAGE_BATCH_MAX_RECORD_BYTES):
+                        chunk.append((index, record))
+                        index += 1
+                        if len(chunk) >= TRIAGE_BATCH_CHUNK:
+                            yield score(chunk)
+                            chunk = []
+                if chunk:
+                    yield score(chunk)
+            except RecordError as e:
+                if chunk:
+                    yield score(chunk)
+                status = {"status": 413} if isinstance(e, BodyTooLarge) else {}
+                yield json.dumps({"index": index, "error": str(e), **status, "fatal": True}) + "\n"
+        except ClientDisconnect:
+            return
+        except HTTPException as e:  # out of quota; `chunk` is the one refused
+            yield json.dumps({"index": chunk[0][0], "error": e.detail, "status": e.status_code, "fatal": True}) + "\n"
+
+    return DuplexStreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _read_stage_uploads(audio: Optional[UploadFile], pdf: Optional[UploadFile],
+                              image: Optional[UploadFile]) -> dict[str, SpooledUpload]:
+    # keyed by the stage that consumes each one; the caller closes them
+    if pdf is not None and not (pdf.filename or "").lower().endswith(".pdf"):
+        raise HTTPException(400, "Upload a PDF")
+    uploads: dict[str, SpooledUpload] = {}
+    try:
+        if audio is not None:
+            uploads["asr"] = await _read(audio, ASR_MAX_BYTES, "Audio too large")
+        if pdf is not None:
+            uploads["ocr"] = await _read(pdf, OCR_MAX_BYTES, "PDF too large")
+        if image is not None:
+            uploads["imaging"] = await _read(image, IMAGING_LARGE_MAX_BYTES, "Image too large")
+    except BaseException:
+        for u in uploads.values():
+            u.close()
+        raise
+    if not uploads:
+        raise HTTPException(400, "Upload at least one of audio, pdf, image")
+    return uploads
+
+@app.post("/analyze", dependencies=[Depends(require_key)])
+async def analyze(request: Request, audio: Optional[UploadFile] = File(None), pdf: Optional[UploadFile] = File(None),
+                  image: Optional[UploadFile] = File(None), preview: bool = Form(False)):
+    """Runs ASR, OCR and imaging concurrently and streams each result as a server-sent event.
+
+    Events: `asr`, `ocr`, `imaging` as each stage finishes (or `error` with the
+    failing stage), then `triage` with the rule engine's verdict over whatever
+    succeeded.
+    """
+    uploads = await _read_stage_uploads(audio, pdf, image)
+    admitted_at = None
+    try:
+        admitted_at = await gates["analyze"].acquire()
+        await _charge(request, uploads)
+    except BaseException:
+        if admitted_at is not None:
+            gates["analyze"].release(admitted_at)
+        for u in uploads.values():
+            u.close()
+        raise
+
+    async def events():
+        results = {}
+        try:
+            async with aclosing(_stages(uploads, preview)) as stages:
+                async for name, out in stages:
+                    if isinstance(out, HTTPException):
+                        yield _sse("error", {"stage": name, "status": out.status_code, "detail": out.detail})
+                    else:
+                        results[name] = _with_preview_url(request, out) if name == "imaging" else out
+                        yield _sse(name, results[name].model_dump())
+            yield _sse("triage", _verdict(results).model_dump())
+        finally:
+            for u in uploads.values():
+                u.close()
+
+    return GatedStreamingResponse(events(), gates["analyze"], admitted_at, media_type="text/event-stream",
+                                  headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ---------- Jobs ----------
+# The same analyses, queued: POST returns a job to poll instead of holding the
+# connection open. Handlers run in whichever worker claims the job and must not
+# close the job's uploads; the store removes them once the job is finished.
+async def _ocr_job(job: Job, progress) -> dict:
+    upload, pages = job.upload("file"), job.params["pages"]
+    total, chunks, selected = 0, [], None
+    async with aclosing(_pdf_pages(upload, pages)) as shards:
+        async for total, shard in shards:
+            chunks += [text for _, text in shard]
+            selected = selected or max(1, len(processing.parse_pages(pages, total)))
+            await progress(len(chunks) / selected)
+    return OCRResponse(text="\n".join(chunks).strip(), pages=total).model_dump()
+
+async def _imaging_job(job: Job, progress) -> dict:
+    return (await _analyze_image(job.upload("file"), job.params["preview"])).model_dump()
+
+async def _asr_job(job: Job, progress) -> dict:
+    return (await _transcribe(job.upload("file"))).model_dump()
+
+async def _analyze_job(job: Job, progress) -> dict:
+    uploads = {name: job.upload(name) for name in job.inputs}
+    results, out = {}, {"errors": []}
+    async with aclosing(_stages(uploads, job.params["preview"])) as stages:
+        async for name, res in stages:
+            if isinstance(res, HTTPException):
+                out["errors"].append({"stage": name, "status": res.status_code, "detail": res.detail})
+            else:
+                results[name] = res
+                out[name] = res.model_dump()
+            await progress((len(results) + len(out["errors"])) / len(uploads))
+    out["triage"] = _verdict(results).model_dump()
+    return out
+
+job_runner = JobRunner(job_store, {"ocr": _ocr_job, "imaging": _imaging_job, "asr": _asr_job, "analyze": _analyze_job},
+                       JOBS_CONCURRENCY, JOBS_POLL_S, JOBS_HEARTBEAT_S, JOBS_STALE_S, JOBS_MAX_ATTEMPTS)
+
+def _job_status(request: Request, job: Job, duplicate: bool = False) -> JobStatus:
+    result = job.result
+    if result is not None:
+        # preview URLs depend on how the service is reached, so they are filled in per request
+        for imaging in (result, result.get("imaging")) if job.kind in ("imaging", "analyze") else ():
+            if imaging and imaging.get("preview_id"):
+                imaging["preview_url"] = str(request.url_for("imaging_preview", preview_id=imaging["preview_id"]))
+    return JobStatus(id=job.id, kind=job.kind, status=job.status, progress=job.progress, result=result,
+                     error=job.error, error_status=job.error_status, attempts=job.attempts,
+                     created=job.created, updated=job.updated, duplicate=duplicate)
+
+async def _submit(request: Request, kind: str, params: dict, uploads: dict[str, SpooledUpload]) -> JSONResponse:
+    # identical content with identical parameters from the same identity maps to
+    # the job already queued, running or done; other identities get their own
+    identity = request.state.identity
+    key = json.dumps([identity, kind, {name: u.sha256 for name, u in sorted(uploads.items())}, params], sort_keys=True)
+    try:
+        await _charge(request, uploads if kind == "analyze" else {kind: uploads["file"]}, params.get("pages"))
+        job, duplicate = await run_in_threadpool(job_store.submit, kind, key, params, uploads, identity)
+    finally:
+        for u in uploads.values():
+            u.close()
+    job_runner.start()  # no-op under lifespan; covers apps driven without it
+    job_runner.wake()
+    return JSONResponse(_job_status(request, job, duplicate).model_dump(), status_code=202,
+                        headers={"Location": str(request.url_for("job_status", job_id=job.id))})
+
+@app.post("/jobs/ocr", dependencies=[Depends(require_key)], status_code=202, response_model=JobStatus)
+async def submit_ocr(request: Request, file: Optional[UploadFile] = File(None), sha256: Optional[str] = Query(None),
+                     upload_id: Optional[str] = Query(None), pages: Optional[str] = Form(None)):
+    upload = await _input(request, file, sha256, upload_id, OCR_MAX_BYTES, "PDF too large", pdf=True)
+    return await _submit(request, "ocr", {"pages": (pages or "").replace(" ", "") or None}, {"file": upload})
+
+@app.post("/jobs/imaging", dependencies=[Depends(require_key)], status_code=202, response_model=JobStatus)
+async def submit_imaging(request: Request, file: Optional[UploadFile] = File(None), sha256: Optional[str] = Query(None),
+                         upload_id: Optional[str] = Query(None), preview: bool = Form(False)):
+    upload = await _input(request, file, sha256, upload_id, IMAGING_LARGE_MAX_BYTES, "Image too large")
+    return await _submit(request, "imaging", {"preview": preview}, {"file": upload})
+
+@app.post("/jobs/asr", dependencies=[Depends(require_key)], status_code=202, response_model=JobStatus)
+async def submit_asr(request: Request, file: Optional[UploadFile] = File(None), upload_id: Optional[str] = Query(None)):
+    upload = await _input(request, file, None, upload_id, ASR_MAX_BYTES, "Audio too large", keep=False)
+    return await _submit(request, "asr", {"backend": asr_backend.name if asr_backend else None},
+                         {"file": upload})
+
+@app.post("/jobs/analyze", dependencies=[Depends(require_key)], status_code=202, response_model=JobStatus)
+async def submit_analyze(request: Request, audio: Optional[UploadFile] = File(None), pdf: Optional[UploadFile] = File(None),
+                         image: Optional[UploadFile] = File(None), preview: bool = Form(False)):
+    uploads = await _read_stage_uploads(audio, pdf, image)
+    return await _submit(request, "analyze", {"preview": preview}, uploads)
+
+@app.get("/jobs/{job_id}", name="job_status", dependencies=[Depends(require_key)], response_model=JobStatus)
+@limiter.limit("60/minute")
+async def job_status(request: Request, job_id: str, wait: float = Query(0, ge=0)):
+    """A job's status, progress and, once done, result; 404 unless the caller submitted it.
+    With `wait`, holds the request up to that many seconds (capped at JOBS_MAX_WAIT_S)
+    for the job to finish."""
+    deadline = time.monotonic() + min(wait, JOBS_MAX_WAIT_S)
+    while True:
+        job = await run_in_threadpool(job_store.get, job_id)
+        if job is None or job.submitter != request.state.identity:  # someone else's job is as good as absent
+            raise HTTPException(404, "Job not found or expired")
+        if job.status in ("done", "failed") or time.monotonic() >= deadline or await request.is_disconnected():
+            return _job_status(request, job)
+        await asyncio.sleep(0.25)
@@ -0,0 +1,82 @@
+# Prometheus instrumentation. With several uvicorn workers, set
+# PROMETHEUS_MULTIPROC_DIR (an empty, writable dir) so /metrics aggregates them.
+import os, time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               REGISTRY, generate_latest, multiprocess)
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120)
+STAGE_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 120)
+
+REQUESTS = Counter("amorai_requests_total", "HTTP requests by route and status", ["endpoint", "method", "status"])
+REQUEST_SECONDS = Histogram("amorai_request_seconds", "HTTP request latency by route", ["endpoint"], buckets=LATENCY_BUCKETS)
+IN_FLIGHT = Gauge("amorai_requests_in_flight", "Requests currently being served", ["endpoint"], multiprocess_mode="livesum")
+STAGE_SECONDS = Histogram("amorai_stage_seconds", "Latency of processing sub-stages", ["stage"], buckets=STAGE_BUCKETS)
+POOL_QUEUE = Gauge("amorai_pool_queue_depth", "Tasks waiting for a free worker-pool slot", multiprocess_mode="livesum")
+POOL_TASKS = Gauge("amorai_pool_tasks", "Tasks submitted to the worker pool and not yet finished", multiprocess_mode="livesum")
+CANCELLED = Counter("amorai_cancelled_total", "Requests abandoned on client disconnect or an expired deadline",
+                    ["endpoint", "reason"])
+POOL_CANCELLED = Counter("amorai_pool_cancelled_total", "Worker-pool tasks abandoned by their caller, by where they were",
+                         ["state"])
+# this process's own share of IN_FLIGHT, which /ready reports (the gauge may be summed across workers)
+in_flight: dict[str, int] = defaultdict(int)
+
+def observe(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+def endpoint(scope) -> str:
+    # the route template, so /imaging/preview/{preview_id} is one series
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+def render() -> tuple[bytes, str]:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+class MetricsMiddleware:
+    """Counts requests and records latency per route template (not raw path)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = endpoint(scope)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        IN_FLIGHT.labels(route).inc()
+        in_flight[route] += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.labels(route).dec()
+            in_flight[route] -= 1
+            if not in_flight[route]:
+                del in_flight[route]
+            REQUEST_SECONDS.labels(route).observe(time.perf_counter() - started)
+            REQUESTS.labels(route, scope["method"], str(status)).inc()
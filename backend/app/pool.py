@@ -0,0 +1,203 @@
+import asyncio, logging, multiprocessing, threading, time
+from array import array
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+log = logging.getLogger("amorai.pool")
+
+CANCEL_SLOTS = 1024  # tasks that can be stopped mid-run at once; any beyond run to completion
+START_POLL_S = 0.05  # first interval for noticing a queued task has started; doubles up to 1s
+
+class TaskCancelled(Exception):
+    """Raised inside a pool task at its next checkpoint() once the caller has given up on it."""
+
+# per slot in shared memory: a cancel flag byte, and the monotonic time the task
+# started running (0 while queued); workers get them via the initializer
+_flags = _starts = None
+_task = threading.local()
+
+def _init(flags, starts) -> None:
+    global _flags, _starts
+    _flags, _starts = flags, starts
+
+def _call(shared, slot: int | None, fn: Callable[..., Any], *args: Any) -> Any:
+    flags, starts = shared if shared is not None else (_flags, _starts)
+    _task.flags, _task.slot = flags, slot
+    if slot is not None:
+        starts[slot] = time.monotonic()  # CLOCK_MONOTONIC is system-wide, so the parent can compare
+    try:
+        return fn(*args)
+    finally:
+        _task.slot = None
+
+def checkpoint() -> None:
+    """Call between steps of long CPU work; stops the task if its caller was cancelled or timed out."""
+    slot = getattr(_task, "slot", None)
+    if slot is not None and _task.flags[slot]:
+        raise TaskCancelled()
+
+class WorkerPool:
+    """Bounded executor for CPU-heavy stages so they never run on the event loop.
+
+    `kind="process"` sidesteps the GIL for PyMuPDF/OpenCV work; `kind="thread"`
+    is handy for local debugging. The executor is created lazily on first use.
+
+    The per-task timeout counts from when a worker starts the task, so time
+    spent queued behind other tasks does not use it up.
+
+    When the awaiting coroutine is cancelled or times out, a task still queued
+    is dropped and a running one is flagged to stop at its next checkpoint().
+
+    A worker that dies (a segfault in native code, an OOM kill) breaks the
+    whole executor: its in-flight tasks raise BrokenExecutor, the executor is
+    replaced, and the new one is warmed again in the background.
+    """
+
+    def __init__(self, size: int, timeout: float, kind: str = "process",
+                 on_change: Callable[["WorkerPool"], None] | None = None,
+                 on_cancel: Callable[[str], None] | None = None):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.kind = kind
+        self.on_change = on_change  # called whenever `pending` moves, e.g. to update gauges
+        self.on_cancel = on_cancel  # called with "queued" or "running" for each abandoned task
+        self.pending = 0
+        self.warmed = False
+        self.restarts = 0
+        self._pool: Executor | None = None
+        self._flags = self._starts = None
+        self._free: list[int] = []
+        self._warm_fn: Callable[[], Any] | None = None
+        self._rewarm: asyncio.Task | None = None
+
+    def _executor(self) -> Executor:
+        if self._pool is None:
+            self._free = list(range(CANCEL_SLOTS))
+            if self.kind == "thread":
+                self._flags = bytearray(CANCEL_SLOTS)
+                self._starts = array("d", bytes(8 * CANCEL_SLOTS))
+                self._pool = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="worker")
+            else:
+                # spawn keeps children free of the parent's event loop and sockets
+                ctx = multiprocessing.get_context("spawn")
+                self._flags = ctx.RawArray("b", CANCEL_SLOTS)
+                self._starts = ctx.RawArray("d", CANCEL_SLOTS)
+                self._pool = ProcessPoolExecutor(max_workers=self.size, mp_context=ctx, initializer=_init,
+                                                 initargs=(self._flags, self._starts))
+        return self._pool
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.pending - self.size)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        executor = self._executor()
+        flags, starts = self._flags, self._starts
+        slot = self._free.pop() if self._free else None
+        self._move(1)
+        try:
+            # shared memory reaches processes through the initializer; threads get it directly
+            cfut = executor.submit(_call, (flags, starts) if self.kind == "thread" else None, slot, fn, *args)
+        except BaseException as e:
+            self._release(flags, slot)
+            self._move(-1)
+            if isinstance(e, BrokenExecutor):
+                self._broken(executor)
+            raise
+        # the slot is reused only once the task has really ended, wherever it was
+        cfut.add_done_callback(lambda _: self._threadsafe(loop, self._release, flags, slot))
+        try:
+            return await self._result(cfut, starts, slot)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if cfut.cancel():
+                self._cancelled("queued")
+            elif not cfut.done():
+                if slot is not None:
+                    flags[slot] = 1
+                self._cancelled("running")
+            raise
+        except BrokenExecutor:
+            self._broken(executor)
+            raise
+        finally:
+            self._move(-1)
+
+    async def _result(self, cfut, starts, slot: int | None) -> Any:
+        fut = asyncio.wrap_future(cfut)
+        if slot is None:  # no start time to go by; the timeout runs from submission
+            return await asyncio.wait_for(fut, self.timeout)
+        poll = START_POLL_S
+        while not starts[slot]:
+            done, _ = await asyncio.wait({fut}, timeout=poll)
+            if done:
+                return fut.result()
+            poll = min(poll * 2, 1.0)
+        return await asyncio.wait_for(fut, max(0.0, starts[slot] + self.timeout - time.monotonic()))
+
+    def _release(self, flags, slot: int | None) -> None:
+        if slot is not None and flags is self._flags:  # else the pool was shut down meanwhile
+            flags[slot] = 0
+            self._starts[slot] = 0
+            self._free.append(slot)
+
+    @staticmethod
+    def _threadsafe(loop: asyncio.AbstractEventLoop, fn: Callable[..., Any], *args: Any) -> None:
+        try:
+            loop.call_soon_threadsafe(fn, *args)
+        except RuntimeError:  # loop already closed
+            pass
+
+    def check(self) -> bool:
+        """Whether the pool is warm and whole; one whose worker died while idle is replaced now."""
+        if self._pool is not None and getattr(self._pool, "_broken", False):
+            self._broken(self._pool)
+        return self.warmed
+
+    def _broken(self, executor: Executor) -> None:
+        if self._pool is not executor:
+            return  # already replaced by another task that saw the same crash
+        log.error("a %s pool worker died; replacing the pool", self.kind)
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._pool = self._flags = self._starts = None
+        self._free = []
+        self.warmed = False
+        self.restarts += 1
+        if self._warm_fn is not None and (self._rewarm is None or self._rewarm.done()):
+            self._rewarm = asyncio.ensure_future(self._rewarm_loop())
+
+    async def _rewarm_loop(self) -> None:
+        while not self.warmed:
+            try:
+                await self.warm(self._warm_fn)
+            except Exception:
+                log.exception("warming the replacement pool failed; retrying")
+                await asyncio.sleep(1)
+
+    def _cancelled(self, state: str) -> None:
+        if self.on_cancel is not None:
+            self.on_cancel(state)
+
+    def _move(self, delta: int) -> None:
+        self.pending += delta
+        if self.on_change is not None:
+            self.on_change(self)
+
+    async def warm(self, fn: Callable[[], Any]) -> None:
+        self._warm_fn = fn
+        await asyncio.gather(*(self.run(fn) for _ in range(self.size)))
+        self.warmed = True
+
+    def state(self) -> dict:
+        running = min(self.pending, self.size)
+        return {"kind": self.kind, "size": self.size, "running": running, "queued": self.queued,
+                "utilization": round(running / self.size, 3), "started": self._pool is not None, "warm": self.warmed,
+                "restarts": self.restarts}
+
+    def shutdown(self) -> None:
+        if self._rewarm is not None:
+            self._rewarm.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._flags = self._starts = None
+            self.warmed = False
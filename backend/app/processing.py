@@ -0,0 +1,301 @@
+# CPU-bound stages. Everything here runs inside the worker pool, so keep it
+# importable without FastAPI and return plain picklable values. Each entry
+# point returns (value, timings); timings is a list of (stage, seconds) that
+# the parent feeds into its metrics, since the children have no registry.
+# Every lap is also a checkpoint where a task whose caller gave up stops early.
+import io, time, wave
+
+import fitz  # PyMuPDF
+from PIL import Image
+import numpy as np
+import cv2
+
+from .pool import checkpoint
+
+try:
+    import pytesseract
+except ImportError:  # optional: without it, pages lacking a text layer stay empty
+    pytesseract = None
+
+# bump the suffix whenever pdf_pages changes what it returns; it keys the OCR cache
+PDF_EXTRACTOR_VERSION = f"pymupdf-{fitz.VersionBind}-2"
+
+Timings = list[tuple[str, float]]
+
+class _Clock:
+    def __init__(self):
+        self.timings: Timings = []
+        self._t = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.timings.append((stage, now - self._t))
+        self._t = now
+        checkpoint()
+
+def warm() -> tuple[bool, Timings]:
+    return True, []
+
+def _open_pdf(src: bytes | str) -> fitz.Document:
+    try:
+        return fitz.open(src, filetype="pdf") if isinstance(src, str) else fitz.open(stream=src, filetype="pdf")
+    except (fitz.FileDataError, RuntimeError):
+        raise ValueError("Unreadable or corrupt PDF")
+
+def _open_image(src: bytes | str) -> Image.Image:
+    return Image.open(src if isinstance(src, str) else io.BytesIO(src))
+
+def parse_pages(spec: str | None, count: int) -> list[int]:
+    """1-based page numbers selected by a spec like "1-3,7,10-" (None or "" = all)."""
+    if not spec or not spec.strip():
+        return list(range(1, count + 1))
+    pages = set()
+    for part in spec.replace(" ", "").split(","):
+        lo, dash, hi = part.partition("-")
+        try:
+            first = int(lo) if lo else 1
+            last = (int(hi) if hi else count) if dash else first
+        except ValueError:
+            raise ValueError(f"Invalid page range: {part!r}")
+        if not 1 <= first <= last <= count:
+            raise ValueError(f"Page range {part!r} outside 1-{count}")
+        pages.update(range(first, last + 1))
+    return sorted(pages)
+
+def pdf_page_count(src: bytes | str) -> tuple[int, Timings]:
+    clock = _Clock()
+    doc = _open_pdf(src)
+    clock.lap("pdf_open")
+    try:
+        return len(doc), clock.timings
+    finally:
+        doc.close()
+
+def pdf_pages(src: bytes | str, pages: list[int]) -> tuple[list[tuple[int, str]], Timings]:
+    # one shard: every worker opens the document itself, so shards run in parallel
+    clock = _Clock()
+    doc = _open_pdf(src)
+    clock.lap("pdf_open")
+    try:
+        out = []
+        for n in pages:
+            out.append((n, doc[n - 1].get_text()))
+            clock.lap("pdf_page")
+        return out, clock.timings
+    finally:
+        doc.close()
+
+def tesseract_version() -> str | None:
+    if pytesseract is None:
+        return None
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except (pytesseract.TesseractNotFoundError, OSError):
+        return None
+
+def ocr_page(src: bytes | str, page: int, dpi: int, lang: str) -> tuple[str, Timings]:
+    # for pages with no text layer: rasterize in grayscale and run Tesseract
+    clock = _Clock()
+    doc = _open_pdf(src)
+    clock.lap("pdf_open")
+    try:
+        pix = doc[page - 1].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        img = Image.frombuffer("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride, 1)
+        clock.lap("pdf_render")
+        try:
+            text = pytesseract.image_to_string(img, lang=lang)
+        except pytesseract.TesseractError as e:
+            raise ValueError(f"OCR failed on page {page}: {e.message}")
+        clock.lap("tesseract")
+        return text, clock.timings
+    finally:
+        doc.close()
+
+def audio_seconds(src: bytes | str, size: int, bytes_per_second: int) -> tuple[float, Timings]:
+    # exact for WAV from its header; other formats are estimated from their size
+    clock = _Clock()
+    try:
+        with wave.open(src if isinstance(src, str) else io.BytesIO(src)) as w:
+            seconds = w.getnframes() / w.getframerate()
+    except (wave.Error, EOFError, ZeroDivisionError):
+        seconds = size / bytes_per_second
+    clock.lap("audio_probe")
+    return seconds, clock.timings
+
+def _imdecode(src: bytes | str, flags: int) -> np.ndarray | None:
+    # straight from the upload buffer or a read-only map of the spooled file; None
+    # when undecodable, including empty input (memmap refuses it, imdecode asserts)
+    try:
+        buf = np.memmap(src, np.uint8, mode="r") if isinstance(src, str) else np.frombuffer(src, np.uint8)
+        return cv2.imdecode(buf, flags)
+    except (ValueError, cv2.error):
+        return None
+
+def image_pixels(src: bytes | str) -> tuple[int, Timings]:
+    # from the header where PIL can read it, without decoding the image
+    clock = _Clock()
+    try:
+        with _open_image(src) as img:
+            pixels = img.size[0] * img.size[1]
+    except (OSError, Image.DecompressionBombError):
+        arr = _imdecode(src, cv2.IMREAD_REDUCED_GRAYSCALE_8)  # 1/64 of a full decode
+        if arr is None:
+            raise ValueError("Unsupported or corrupt image")
+        pixels = arr.size * 64
+    clock.lap("image_probe")
+    return pixels, clock.timings
+
+# Canny's edge pixels shrink with the image (outlines get shorter by the scale
+# factor while the area shrinks by its square), so edges found on a reduced
+# copy overstate the full-resolution density by about scale**exponent. Fitted
+# by bench/calibrate_imaging.py (log-log slope 1.07 at max_side 1024 and 2048);
+# re-run it before changing the metrics.
+EDGE_SCALE_EXPONENT = 1.07
+BAND_ROWS = 512
+BAND_HALO = 16  # rows of context around each Canny band, enough for hysteresis to settle
+
+# imdecode flags by reduction factor; libjpeg decodes these at 1/2, 1/4 or 1/8
+# scale directly, other formats are decoded in full and then resized by OpenCV
+_DECODE_FLAGS = {
+    1: (cv2.IMREAD_GRAYSCALE, cv2.IMREAD_COLOR),
+    2: (cv2.IMREAD_REDUCED_GRAYSCALE_2, cv2.IMREAD_REDUCED_COLOR_2),
+    4: (cv2.IMREAD_REDUCED_GRAYSCALE_4, cv2.IMREAD_REDUCED_COLOR_4),
+    8: (cv2.IMREAD_REDUCED_GRAYSCALE_8, cv2.IMREAD_REDUCED_COLOR_8),
+}
+
+def _reduction(src: bytes | str, max_pixels: int) -> int:
+    # smallest factor that keeps the decoded image within max_pixels, from the header
+    if not max_pixels:
+        return 1
+    try:
+        with _open_image(src) as img:
+            pixels = img.size[0] * img.size[1]
+    except Image.DecompressionBombError:
+        return 8
+    except OSError:
+        return 1  # not for PIL; _decode reports it if OpenCV cannot read it either
+    return next((f for f in (1, 2, 4) if pixels <= max_pixels * f * f), 8)
+
+def _decode(src: bytes | str, color: bool, reduce: int = 1) -> np.ndarray:
+    # decode once, straight from the upload buffer (or a read-only map of the
+    # spooled file): grayscale when only metrics are needed, BGR for previews
+    arr = _imdecode(src, _DECODE_FLAGS[reduce][color])
+    if arr is None:  # formats OpenCV cannot read (GIF, some TIFFs): let PIL try
+        try:
+            img = _open_image(src)
+            if reduce > 1:
+                img = img.reduce(reduce)
+        except (OSError, Image.DecompressionBombError):
+            raise ValueError("Unsupported or corrupt image")
+        arr = np.asarray(img.convert("RGB")) if color else np.asarray(img.convert("L"))
+        if color:
+            arr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+    return arr
+
+def _lap_var(gray: np.ndarray) -> float:
+    # variance of the 3x3 Laplacian, a band of rows at a time; int16 holds it
+    # exactly for uint8 input, so this matches one whole-image CV_64F pass
+    h = gray.shape[0]
+    total = total_sq = 0.0
+    for y0 in range(0, h, BAND_ROWS):
+        checkpoint()
+        y1 = min(h, y0 + BAND_ROWS)
+        a, b = max(0, y0 - 1), min(h, y1 + 1)
+        lap = cv2.Laplacian(gray[a:b], cv2.CV_16S)[y0 - a:y1 - a]
+        mean, std = cv2.meanStdDev(lap)
+        total += float(mean[0, 0]) * lap.size
+        total_sq += (float(std[0, 0])**2 + float(mean[0, 0])**2) * lap.size
+    return total_sq / gray.size - (total / gray.size)**2
+
+def _canny(gray: np.ndarray, tile_pixels: int) -> np.ndarray:
+    if not tile_pixels or gray.size <= tile_pixels:
+        return cv2.Canny(gray, 50, 150)
+    # oversize: run Canny in overlapping row bands so its gradient buffers stay
+    # band-sized; only hysteresis chains longer than the halo can differ
+    h = gray.shape[0]
+    edges = np.empty_like(gray)
+    for y0 in range(0, h, BAND_ROWS):
+        checkpoint()
+        y1 = min(h, y0 + BAND_ROWS)
+        a, b = max(0, y0 - BAND_HALO), min(h, y1 + BAND_HALO)
+        edges[y0:y1] = cv2.Canny(gray[a:b], 50, 150)[y0 - a:y1 - a]
+    return edges
+
+def _metrics(gray: np.ndarray, edges: np.ndarray, scale: float = 1.0) -> dict:
+    mean_int = cv2.mean(gray)[0]/255.0
+    edge_density = cv2.countNonZero(edges)/edges.size / scale**EDGE_SCALE_EXPONENT
+    blur = _lap_var(gray)
+    blur_score = float(min(1.0, max(0.0, 1.0 - (blur/200.0))))
+    return {"mean_intensity": float(mean_int), "edge_density": float(edge_density), "blur_score": blur_score}
+
+def _fit(arr: np.ndarray, max_side: int) -> np.ndarray:
+    h, w = arr.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1:
+        return arr
+    return cv2.resize(arr, (max(1, round(w*scale)), max(1, round(h*scale))), interpolation=cv2.INTER_AREA)
+
+def _shrink(arr: np.ndarray, max_side: int) -> np.ndarray:
+    # pyramid halvings are far cheaper than one large INTER_AREA step
+    while max(arr.shape[:2]) >= 2 * max_side:
+        arr = cv2.pyrDown(arr)
+    return _fit(arr, max_side)
+
+def imaging(src: bytes | str, preview: bool, preview_max_side: int = 1024, max_side: int = 0,
+            tile_pixels: int = 0, max_pixels: int = 0) -> tuple[tuple[dict, bytes | None], Timings]:
+    """Metrics plus, optionally, a lossless edge-overlay master no larger than `preview_max_side`.
+
+    One decode and one Canny pass feed both the metrics and the overlay. With
+    `max_side`, Canny runs on a copy pyramid-downsampled to that size and the edge
+    density is scaled back; the blur score always comes from full-resolution
+    pixels, since downsampling removes exactly the detail it measures. Images
+    larger than `max_pixels` are decoded at 1/2, 1/4 or 1/8 scale instead
+    (`decode_scale` in the metrics) and get no blur score, and full-resolution
+    images over `tile_pixels` run Canny in row bands.
+    """
+    clock = _Clock()
+    reduce = _reduction(src, max_pixels)
+    img = _decode(src, color=preview, reduce=reduce)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if preview else img
+    clock.lap("image_decode")
+    # the metrics' Canny scale depends only on max_side, never on `preview`
+    small = _shrink(gray, max_side) if max_side else gray
+    edges = _canny(small, tile_pixels)
+    metrics = _metrics(gray, edges, reduce * max(gray.shape) / max(small.shape))
+    metrics["decode_scale"] = float(reduce)
+    if reduce > 1:
+        # no fixed correction exists: downscaling averages sensor noise away
+        # (variance falls) but sharpens soft images (it rises); see
+        # bench/calibrate_imaging.py
+        metrics["blur_score"] = None
+    clock.lap("canny_laplacian")
+    if not preview:
+        return (metrics, None), clock.timings
+    base = _fit(img, preview_max_side)
+    del img
+    if max(edges.shape) >= max(base.shape):
+        # an edge survives downscaling if it covered at least a quarter of its block
+        mask = cv2.resize(edges, base.shape[1::-1], interpolation=cv2.INTER_AREA) >= 64
+    else:  # max_side below the preview size: find the overlay's edges at preview scale
+        mask = cv2.Canny(cv2.cvtColor(base, cv2.COLOR_BGR2GRAY), 50, 150) > 0
+    del gray, small, edges
+    # same as addWeighted(arr, 0.8, overlay, 0.2) with red edges, but only on edge pixels
+    base[mask] = np.clip(base[mask] * 0.8 + (0.5, 0.5, 51.5), 0, 255).astype(np.uint8)
+    _, buf = cv2.imencode(".png", base, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    clock.lap("preview_encode")
+    return (metrics, buf.tobytes()), clock.timings
+
+PREVIEW_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+    "png": (".png", None, "image/png"),
+}
+
+def render_preview(master: bytes, max_side: int, fmt: str, quality: int) -> tuple[bytes, Timings]:
+    clock = _Clock()
+    arr = cv2.imdecode(np.frombuffer(master, np.uint8), cv2.IMREAD_COLOR)
+    ext, flag, _ = PREVIEW_FORMATS[fmt]
+    params = [flag, quality] if flag is not None else [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    _, buf = cv2.imencode(ext, _fit(arr, max_side), params)
+    clock.lap("preview_encode")
+    return buf.tobytes(), clock.timings
@@ -0,0 +1,63 @@
+import math, time
+
+from fastapi import HTTPException
+from limits import RateLimitItem, parse
+from limits.strategies import RateLimiter
+
+class CostQuotas:
+    """Per-client budgets in cost units rather than request counts.
+
+    A request's cost is the sum over the units of work it asks for
+    ("request", "page", "megapixel", "audio_second", ...) of each unit's
+    weight times the amount, rounded up. Each identity has its quota (a limits string such as
+    "3000/hour", from `quotas` or `default`) counted in `strategy`, the same
+    rate-limit storage the per-request limits use, so it is shared across
+    workers whenever those limits are. Disabled, nothing is charged.
+    """
+
+    def __init__(self, strategy: RateLimiter, weights: dict[str, float], quotas: dict[str, str], default: str,
+                 enabled: bool = True):
+        self.strategy = strategy
+        self.enabled = enabled
+        self.weights = weights
+        self.default = parse(default)
+        self.quotas: dict[str, RateLimitItem] = {name: parse(q) for name, q in quotas.items()}
+
+    def cost(self, units: dict[str, float]) -> int:
+        return math.ceil(sum(self.weights.get(k, 0) * v for k, v in units.items()))
+
+    def quota(self, identity: str) -> RateLimitItem:
+        return self.quotas.get(identity, self.default)
+
+    def charge(self, identity: str, units: dict[str, float]) -> int:
+        """Deducts the cost of `units` from `identity`'s quota, or raises 429 with Retry-After."""
+        cost = self.cost(units)
+        if not self.enabled or cost <= 0:
+            return 0
+        quota = self.quota(identity)
+        if cost > quota.amount:
+            raise HTTPException(413, f"Request costs {cost} units, more than the whole quota of {quota}")
+        # test first: a failed hit still adds to the window, and a refused request should not spend quota
+        if not (self.strategy.test(quota, "cost", identity, cost=cost)
+                and self.strategy.hit(quota, "cost", identity, cost=cost)):
+            reset, remaining = self.strategy.get_window_stats(quota, "cost", identity)
+            raise HTTPException(429, f"Cost quota exceeded: request costs {cost} units, {remaining} of {quota} left",
+                                headers={"Retry-After": str(max(1, math.ceil(reset - time.time())))})
+        return cost
+
+    def remaining(self, identity: str) -> dict:
+        quota = self.quota(identity)
+        reset, remaining = self.strategy.get_window_stats(quota, "cost", identity)
+        return {"quota": str(quota), "remaining": remaining, "reset": int(reset)}
+
+def parse_weights(spec: str) -> dict[str, float]:
+    # "page=1,megapixel=0.5" -> {"page": 1.0, "megapixel": 0.5}
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        out[name.strip()] = float(value)
+    return out
+
+def parse_quotas(spec: str) -> dict[str, str]:
+    # "clinic-a=6000/hour,clinic-b=500/minute" -> {"clinic-a": "6000/hour", ...}
+    return dict((name.strip(), q.strip()) for name, _, q in (p.partition("=") for p in spec.split(",") if p.strip()))
@@ -0,0 +1,89 @@
+# SQLite-backed storage for `limits`/slowapi, so every uvicorn worker on a box
+# shares one set of counters without running Redis. Importing this module
+# registers the `sqlite://` scheme, e.g. RATELIMIT_STORAGE_URI=sqlite:////var/run/amorai/ratelimit.db
+import os, time, sqlite3, threading
+
+from limits.storage import Storage
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key    TEXT PRIMARY KEY,
+    value  INTEGER NOT NULL,
+    expiry REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+# one atomic statement per hit: restart the window if it has expired, else add
+_INCR = """
+INSERT INTO counters (key, value, expiry) VALUES (?1, ?2, ?3 + ?4)
+ON CONFLICT (key) DO UPDATE SET
+    value  = CASE WHEN expiry <= ?3 THEN excluded.value  ELSE value + excluded.value END,
+    expiry = CASE WHEN expiry <= ?3 THEN excluded.expiry ELSE expiry END
+RETURNING value
+"""
+
+class SQLiteStorage(Storage):
+    """Fixed-window counters in a WAL-mode SQLite file shared between processes.
+
+    Each check is a single upsert on a per-thread connection; with WAL and
+    `synchronous=OFF` that stays in the tens of microseconds, and SQLite's
+    write lock keeps counts exact across workers. Expired rows are swept
+    every `purge_every` increments.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, purge_every: int = 1000, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        # SQLAlchemy's convention: sqlite:///rel.db is relative, sqlite:////abs/path.db absolute
+        rest = uri.split("://", 1)[1]
+        self.path = rest[1:] if rest.startswith("/") else rest
+        self.path = self.path or "ratelimit.db"
+        self.purge_every = int(purge_every)
+        self._local = threading.local()
+        self._hits = 0
+        self._conn()  # fail fast on a bad path
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        now = time.time()
+        conn = self._conn()
+        value = conn.execute(_INCR, (key, amount, now, expiry)).fetchone()[0]
+        self._hits += 1
+        if self._hits % self.purge_every == 0:
+            conn.execute("DELETE FROM counters WHERE expiry <= ?", (now,))
+        return value
+
+    def get(self, key: str) -> int:
+        row = self._conn().execute("SELECT value FROM counters WHERE key = ? AND expiry > ?", (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self._conn().execute("SELECT expiry FROM counters WHERE key = ? AND expiry > ?", (key, time.time())).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self._conn().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int | None:
+        return self._conn().execute("DELETE FROM counters").rowcount
+
+    def clear(self, key: str) -> None:
+        self._conn().execute("DELETE FROM counters WHERE key = ?", (key,))
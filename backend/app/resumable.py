@@ -0,0 +1,151 @@
+import os, re, json, time, fcntl, hashlib, secrets
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from .blobs import BlobStore
+from .uploads import CHUNK_SIZE, SpooledUpload
+
+UPLOAD_ID = re.compile(r"^[A-Za-z0-9_-]{22}$")
+
+class ResumableUploads:
+    """Files sent in pieces over as many requests as it takes: create, PATCH at offsets, finalize.
+
+    Each upload is `<id>`, the bytes received so far (its size is the
+    committed offset), and `<id>.json` with the declared length, filename and
+    content type. Chunks go straight to disk; a PATCH cut off midway keeps
+    what arrived, and the client resumes from the offset HEAD reports. A PATCH
+    holds an exclusive flock on the file, so workers cannot interleave
+    writes. Finalizing hashes the file into the blob store, after which the
+    upload ID stands for that blob. Uploads untouched for `ttl` seconds are
+    swept. Unfinished uploads reserve their declared length against
+    `total_bytes`, and `create` is refused once the directory would exceed it.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float, total_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = total_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, upload_id: str) -> str:
+        if not UPLOAD_ID.match(upload_id):
+            raise HTTPException(404, "Unknown upload")
+        return os.path.join(self.directory, upload_id)
+
+    def _write_meta(self, path: str, meta: dict) -> None:
+        tmp = f"{path}.json.{secrets.token_hex(4)}"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, f"{path}.json")
+
+    def create(self, length: int, filename: str, content_type: Optional[str]) -> dict:
+        if length > self.max_bytes:
+            raise HTTPException(413, f"Uploads are limited to {self.max_bytes} bytes")
+        self.sweep()
+        with open(os.path.join(self.directory, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # serializes the check against other workers' creates
+            if self._reserved() + length > self.total_bytes:
+                raise HTTPException(507, "Upload storage is full; try again later", headers={"Retry-After": "60"})
+            upload_id = secrets.token_urlsafe(16)
+            path = self._path(upload_id)
+            open(path, "xb").close()
+            meta = {"id": upload_id, "length": length, "filename": filename, "content_type": content_type,
+                    "created": time.time(), "sha256": None}
+            self._write_meta(path, meta)
+        return {**meta, "offset": 0}
+
+    def _reserved(self) -> int:
+        # declared lengths of unfinished uploads; finalized ones have moved to the blob store
+        total = 0
+        for e in os.scandir(self.directory):
+            if e.name.endswith(".json"):
+                try:
+                    with open(e.path) as f:
+                        meta = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    continue
+                if not meta["sha256"]:
+                    total += meta["length"]
+        return total
+
+    def get(self, upload_id: str) -> dict:
+        path = self._path(upload_id)
+        try:
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise HTTPException(404, "Unknown upload")
+        if meta["sha256"]:
+            return {**meta, "offset": meta["length"]}
+        try:
+            return {**meta, "offset": os.path.getsize(path)}
+        except FileNotFoundError:  # swept or finalized between the two reads
+            raise HTTPException(404, "Unknown upload")
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """Writes a PATCH body at `offset`, which must be the current offset; returns the new one."""
+        meta = await run_in_threadpool(self.get, upload_id)
+        if meta["sha256"]:
+            raise HTTPException(409, "Upload already finalized")
+        try:
+            f = await run_in_threadpool(open, self._path(upload_id), "r+b")
+        except FileNotFoundError:
+            raise HTTPException(404, "Unknown upload")
+        try:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise HTTPException(409, "Another PATCH to this upload is in progress")
+            size = os.fstat(f.fileno()).st_size
+            if offset != size:
+                raise HTTPException(409, f"Upload-Offset must be {size}", headers={"Upload-Offset": str(size)})
+            f.seek(size)
+            async for chunk in chunks:
+                if size + len(chunk) > meta["length"]:
+                    raise HTTPException(413, "Chunk runs past the declared upload length")
+                await run_in_threadpool(f.write, chunk)
+                size += len(chunk)
+            return size
+        finally:
+            await run_in_threadpool(f.close)  # flushes whatever arrived, even if the client dropped
+
+    def finalize(self, upload_id: str, blobs: BlobStore, owner: str) -> dict:
+        path = self._path(upload_id)
+        meta = self.get(upload_id)
+        if meta["sha256"]:
+            return meta  # finalizing twice is harmless
+        if meta["offset"] != meta["length"]:
+            raise HTTPException(409, f"Upload incomplete: {meta['offset']} of {meta['length']} bytes",
+                                headers={"Upload-Offset": str(meta["offset"])})
+        with open(path, "rb") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise HTTPException(409, "A PATCH to this upload is in progress")
+            digest = hashlib.sha256()
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+            meta["sha256"] = digest.hexdigest()
+            blobs.put(SpooledUpload(meta["filename"], meta["content_type"], meta["length"], meta["sha256"], path=path), owner)
+            self._write_meta(path, {k: v for k, v in meta.items() if k != "offset"})
+        os.unlink(path)
+        return meta
+
+    def sweep(self) -> None:
+        cutoff = time.time() - self.ttl
+        for e in os.scandir(self.directory):
+            if e.name.endswith(".json") and e.stat().st_mtime < cutoff:
+                data = e.path[:-len(".json")]
+                try:
+                    if os.path.getmtime(data) >= cutoff:
+                        continue  # still being written
+                    os.unlink(data)
+                except FileNotFoundError:
+                    pass
+                try:
+                    os.unlink(e.path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,116 @@
+# Declarative triage rules, compiled once into a keyword matcher. Add rules to
+# the tables below; past a hundred or so keywords the scan stays one pass over
+# the text however many more there are.
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# up to this many keywords a substring test per keyword (memchr-fast) beats one
+# regex pass, which pays per character; measured with bench/bench_rules.py
+FIND_MAX_KEYWORDS = 128
+
+@dataclass(frozen=True)
+class TextRule:
+    keywords: tuple[str, ...]
+    alert: Optional[str] = None
+    score: int = 0  # added once if any keyword matches
+
+@dataclass(frozen=True)
+class VitalRule:
+    keyword: str          # cheap trigger found by the matcher
+    pattern: str          # full extractor, group 1 is the numeric value
+    evidence: str
+    below: int
+    alert: str
+    score: int = 0        # added once if the value is below `below`
+
+TEXT_RULES = (
+    TextRule(("chest pain", "pressure", "tightness"), alert="Possible cardiac chest pain"),
+    # not scored: the old alert-based check compared against the wrong case and never fired
+    TextRule(("shortness of breath", "dyspnea"), alert="Respiratory distress"),
+    TextRule(("chest pain", "faint", "collapse"), score=2),
+)
+
+VITAL_RULES = (
+    VitalRule("oxygen", r"oxygen[^0-9]*([0-9]{2})", "spo2", below=92, alert="Low SpO₂", score=2),
+)
+
+def _trie_pattern(words: list[str]) -> str:
+    # factor shared prefixes so the regex engine tests one character class per
+    # position instead of trying every keyword in turn
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class RuleSet:
+    def __init__(self, text_rules=TEXT_RULES, vital_rules=VITAL_RULES):
+        self.text_rules = tuple(text_rules)
+        self.vital_rules = tuple(vital_rules)
+        self._vital_patterns = [re.compile(v.pattern) for v in self.vital_rules]
+        self._n_rules = len(self.text_rules) + len(self.vital_rules)
+
+        # keyword -> rule ids; text rules first, then vital rules offset by len(text_rules)
+        hits: dict[str, set[int]] = {}
+        for i, rule in enumerate(self.text_rules):
+            for kw in rule.keywords:
+                hits.setdefault(kw.lower(), set()).add(i)
+        for j, rule in enumerate(self.vital_rules):
+            hits.setdefault(rule.keyword.lower(), set()).add(len(self.text_rules) + j)
+        words = sorted(hits)
+        # the matcher reports one keyword per match, so a keyword also fires
+        # every keyword contained in it ("chest pain" implies "pain")
+        self._fires = {w: set().union(*(hits[o] for o in words if o in w)) for w in words}
+        self._words = tuple(words)
+        self._matcher = re.compile(_trie_pattern(words) or "(?!)") if len(words) > FIND_MAX_KEYWORDS else None
+
+    def _keywords(self, txt: str):
+        # keywords present in `txt`, each at least once
+        if self._matcher is None:
+            yield from (w for w in self._words if w in txt)
+            return
+        pos = 0
+        while (m := self._matcher.search(txt, pos)) is not None:
+            yield m.group()
+            # resume inside the match, not after it: a keyword can start within
+            # this one and run past it ("tightness" / "shortness")
+            pos = m.start() + 1
+
+    def evaluate(self, txt: str) -> tuple[list[str], int, dict]:
+        """Scan lowercased `txt`; returns (alerts, score, evidence) in table order."""
+        fired: set[int] = set()
+        seen: set[str] = set()
+        for kw in self._keywords(txt):
+            if kw not in seen:
+                seen.add(kw)
+                fired |= self._fires[kw]
+                if len(fired) == self._n_rules:
+                    break
+        alerts, score, ev = [], 0, {}
+        for i, rule in enumerate(self.text_rules):
+            if i in fired:
+                if rule.alert:
+                    alerts.append(rule.alert)
+                score += rule.score
+        for j, rule in enumerate(self.vital_rules):
+            if len(self.text_rules) + j not in fired:
+                continue
+            m = self._vital_patterns[j].search(txt, txt.find(rule.keyword))
+            if m:
+                value = int(m.group(1))
+                ev[rule.evidence] = value
+                if value < rule.below:
+                    alerts.append(rule.alert)
+                    score += rule.score
+        return alerts, score, ev
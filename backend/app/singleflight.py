@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one running computation.
+
+    The first caller for a key starts `start()` as a task; callers arriving
+    while it runs await the same task and get the same result or exception.
+    A caller that is cancelled only stops waiting; the computation is
+    cancelled once no caller is left waiting for it. Nothing is kept after
+    completion; caching results is the caller's business.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, _Call] = {}
+        self.started = self.joined = 0
+
+    async def do(self, key: Hashable, start: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(start()))
+            call.task.add_done_callback(lambda task: self._done(key, call, task))
+            self.started += 1
+        else:
+            self.joined += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # everyone gave up; a newcomer should start afresh, not join a dying task
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _done(self, key: Hashable, call: _Call, task: asyncio.Task) -> None:
+        self._forget(key, call)
+        if not task.cancelled():
+            task.exception()  # waiters re-raise it themselves; don't warn about abandoned ones
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "started": self.started, "joined": self.joined}
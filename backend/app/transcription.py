@@ -0,0 +1,61 @@
+import importlib
+from abc import ABC, abstractmethod
+from typing import Callable
+
+import httpx
+from fastapi import HTTPException
+
+from . import metrics
+from .uploads import SpooledUpload
+
+class TranscriptionBackend(ABC):
+    """Turns one audio upload into text.
+
+    `name` goes into ASR cache keys, so change it whenever the same audio
+    would transcribe differently. Failures are raised as HTTPException with
+    the status the client should see. A subclass without `transcribe` cannot
+    be instantiated, so ASR_BACKEND fails at startup rather than per request.
+    """
+
+    name = "backend"
+
+    @abstractmethod
+    async def transcribe(self, upload: SpooledUpload) -> str: ...
+
+class WhisperBackend(TranscriptionBackend):
+    """OpenAI's /audio/transcriptions, or anything that speaks it (see bench/fake_whisper.py)."""
+
+    def __init__(self, client: Callable[[], httpx.AsyncClient], base_url: str, api_key: str, model: str):
+        self.client = client  # a getter: the shared client is created lazily and may be replaced
+        self.base_url = base_url
+        self.api_key = api_key
+        self.name = self.model = model
+
+    async def transcribe(self, upload: SpooledUpload) -> str:
+        audio = upload.open()
+        try:
+            with metrics.timed("whisper_upstream"):
+                r = await self.client().post(
+                    f"{self.base_url}/audio/transcriptions",
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    files={"file": (upload.filename, audio, upload.content_type or "audio/mpeg")},
+                    data={"model": self.model}
+                )
+        except httpx.TimeoutException:
+            raise HTTPException(504, "Transcription upstream timed out")
+        except httpx.TransportError as e:
+            raise HTTPException(502, f"Transcription upstream unreachable: {e.__class__.__name__}")
+        finally:
+            if not isinstance(audio, bytes):
+                audio.close()
+        if r.status_code != 200:
+            raise HTTPException(r.status_code, r.text)
+        return r.json().get("text", "")
+
+def load_backend(spec: str) -> TranscriptionBackend:
+    # "package.module:factory", called with no arguments
+    module, _, attr = spec.partition(":")
+    backend = getattr(importlib.import_module(module), attr)()
+    if not isinstance(backend, TranscriptionBackend):
+        raise TypeError(f"{spec} returned {type(backend).__name__}, not a TranscriptionBackend")
+    return backend
@@ -0,0 +1,134 @@
+import os, json, hashlib, secrets, tempfile
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+CHUNK_SIZE = 1 << 20
+MULTIPART_SLACK = 64 * 1024  # boundaries + part headers on top of the file itself
+
+class BodyLimitMiddleware:
+    """Rejects oversized request bodies while they are still arriving.
+
+    `limits` maps a path to its maximum body size. A declared Content-Length
+    over the limit is refused before a single byte is read; chunked bodies are
+    counted as they stream in and cut off as soon as they cross it.
+    """
+
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+        limit += MULTIPART_SLACK
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                return await _reject(send)
+
+        seen = 0
+        started = rejected = False
+
+        async def counting_receive():
+            nonlocal seen, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                seen += len(message.get("body", b""))
+                if seen > limit:
+                    # answer now and make the app see a disconnect so parsing stops
+                    rejected = True
+                    if not started:
+                        await _reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        await self.app(scope, counting_receive, guarded_send)
+
+async def _reject(send):
+    body = json.dumps({"detail": "Upload too large"}).encode()
+    await send({"type": "http.response.start", "status": 413,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                            (b"connection", b"close")]})
+    await send({"type": "http.response.body", "body": body})
+
+@dataclass
+class SpooledUpload:
+    filename: str
+    content_type: Optional[str]
+    size: int
+    sha256: str
+    data: Optional[bytes] = None  # small uploads stay in memory
+    path: Optional[str] = None    # larger ones are spooled to disk
+
+    @property
+    def source(self) -> bytes | str:
+        # what the CPU stages accept: raw bytes or a file path they open themselves
+        return self.path if self.path is not None else self.data
+
+    def open(self):
+        return open(self.path, "rb") if self.path is not None else self.data
+
+    def clone(self) -> "SpooledUpload":
+        # an independently closable handle on the same content: a hard link to
+        # the spooled file, so whoever closes first does not pull it from the other
+        if self.path is None:
+            return replace(self)
+        path = f"{self.path}.{secrets.token_hex(4)}"
+        os.link(self.path, path)
+        return replace(self, path=path)
+
+    def close(self) -> None:
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+async def read_upload(file: UploadFile, limit: int, spool_threshold: int, spool_dir: Optional[str] = None,
+                      detail: str = "Upload too large") -> SpooledUpload:
+    """Consume `file` chunk by chunk, enforcing `limit` as bytes arrive.
+
+    Anything above `spool_threshold` is written to a named temp file so PyMuPDF
+    and OpenCV can open it by path instead of holding a second copy in RAM.
+    """
+    buf = bytearray()
+    digest = hashlib.sha256()
+    tmp = None
+    size = 0
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > limit:
+                raise HTTPException(413, detail)
+            digest.update(chunk)
+            if tmp is None and size > spool_threshold:
+                tmp = tempfile.NamedTemporaryFile(prefix="upload-", dir=spool_dir, delete=False)
+                await run_in_threadpool(tmp.write, bytes(buf))
+                buf = bytearray()
+            if tmp is not None:
+                await run_in_threadpool(tmp.write, chunk)
+            else:
+                buf += chunk
+    except BaseException:
+        if tmp is not None:
+            tmp.close()
+            os.unlink(tmp.name)
+        raise
+    if tmp is not None:
+        tmp.close()
+        return SpooledUpload(file.filename or "upload", file.content_type, size, digest.hexdigest(), path=tmp.name)
+    return SpooledUpload(file.filename or "upload", file.content_type, size, digest.hexdigest(), data=bytes(buf))
@@ -0,0 +1,102 @@
+import io, math, wave
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+@dataclass
+class Segment:
+    index: int
+    start: float  # seconds from the start of the stream
+    end: float
+    pcm: bytes    # 16-bit little-endian mono
+
+    def wav(self, sample_rate: int) -> bytes:
+        out = io.BytesIO()
+        with wave.open(out, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(sample_rate)
+            w.writeframes(self.pcm)
+        return out.getvalue()
+
+class Segmenter:
+    """Energy-based voice activity detection over a stream of 16-bit mono PCM.
+
+    Audio is cut into `frame_ms` frames; a frame is voiced when its RMS level
+    is above `threshold_dbfs`. A segment opens at the first voiced frame (with
+    `preroll_ms` of audio before it, so soft onsets survive) and closes after
+    `silence_ms` of unvoiced frames or at `max_segment_s`. Segments with less
+    than `min_speech_ms` of voiced audio are dropped as noise. Only the open
+    segment is buffered.
+    """
+
+    def __init__(self, sample_rate: int, frame_ms: int = 30, threshold_dbfs: float = -40, silence_ms: int = 500,
+                 min_speech_ms: int = 200, max_segment_s: float = 30, preroll_ms: int = 200):
+        self.sample_rate = sample_rate
+        self.frame = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame * 2
+        self.threshold = 32768 * 10 ** (threshold_dbfs / 20)
+        self.silence_frames = max(1, math.ceil(silence_ms / frame_ms))
+        self.min_speech_frames = max(1, math.ceil(min_speech_ms / frame_ms))
+        self.max_frames = max(1, int(max_segment_s * 1000 / frame_ms))
+        self.tail_frames = math.ceil(preroll_ms / frame_ms)  # trailing silence kept, same as the lead-in
+        self._preroll: deque[bytes] = deque(maxlen=self.tail_frames)
+        self._pending = b""  # an incomplete frame
+        self._frames: list[bytes] = []  # the open segment
+        self._start = 0  # its first frame
+        self._pos = 0    # frames seen
+        self._speech = self._quiet = 0
+        self._count = 0
+
+    def feed(self, data: bytes) -> list[Segment]:
+        buf = self._pending + data
+        n = len(buf) - len(buf) % self.frame_bytes
+        self._pending = buf[n:]
+        out = []
+        if n:
+            frames = np.frombuffer(buf, "<i2", n // 2).reshape(-1, self.frame).astype(np.float32)
+            voiced = np.sqrt(np.mean(frames * frames, axis=1)) > self.threshold
+            for i, v in enumerate(voiced):
+                self._step(buf[i * self.frame_bytes:(i + 1) * self.frame_bytes], bool(v), out)
+        return out
+
+    def flush(self) -> list[Segment]:
+        """Ends the stream, closing any open segment."""
+        out = []
+        if self._frames:
+            if self._pending:
+                self._frames.append(self._pending)
+            self._cut(out)
+        self._pending = b""
+        return out
+
+    def _step(self, frame: bytes, voiced: bool, out: list) -> None:
+        self._pos += 1
+        if not self._frames:
+            if voiced:
+                self._start = self._pos - 1 - len(self._preroll)
+                self._frames = [*self._preroll, frame]
+                self._preroll.clear()
+                self._speech, self._quiet = 1, 0
+            else:
+                self._preroll.append(frame)
+            return
+        self._frames.append(frame)
+        if voiced:
+            self._speech += 1
+            self._quiet = 0
+        else:
+            self._quiet += 1
+        if self._quiet >= self.silence_frames or len(self._frames) >= self.max_frames:
+            self._cut(out)
+
+    def _cut(self, out: list) -> None:
+        if self._speech >= self.min_speech_frames:
+            frames = self._frames[:len(self._frames) - max(0, self._quiet - self.tail_frames)]
+            pcm = b"".join(frames)
+            start = self._start * self.frame / self.sample_rate
+            out.append(Segment(self._count, start, start + len(pcm) / 2 / self.sample_rate, pcm))
+            self._count += 1
+        self._frames = []
+        self._speech = self._quiet = 0
@@ -0,0 +1,49 @@
+"""Regression check: /triage/batch with a client that sends the whole body before reading.
+
+    cd backend && python -m bench.batch_check [--records 50000] [--timeout 60]
+
+httpx (like requests) writes the full request body before it reads any of the
+response. With a body far larger than the socket buffers, a server that only
+reads as fast as it writes results would deadlock against such a client. This
+starts uvicorn, posts `--records` NDJSON records (about 420 bytes each, so the
+default is ~21 MB) and exits non-zero unless every record comes back scored
+within `--timeout` seconds.
+"""
+import argparse, json, os, subprocess, sys, time
+
+import httpx
+
+from bench.load import BACKEND, TRIAGE, free_port, wait_up
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=50000)
+    ap.add_argument("--timeout", type=float, default=60)
+    args = ap.parse_args()
+
+    record = dict(TRIAGE, transcript_text=TRIAGE["transcript_text"] + " " + "no known allergies " * 16)
+    body = "".join(json.dumps(record) + "\n" for _ in range(args.records)).encode()
+    port = free_port()
+    env = dict(os.environ, RATELIMIT_ENABLED="0", API_KEY="", API_KEYS="")
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)], cwd=BACKEND, env=env)
+    try:
+        wait_up(f"http://127.0.0.1:{port}/health", proc)
+        started = time.perf_counter()
+        try:
+            r = httpx.post(f"http://127.0.0.1:{port}/triage/batch", content=body, timeout=args.timeout,
+                           headers={"Content-Type": "application/x-ndjson"})
+        except httpx.TimeoutException as e:
+            raise SystemExit(f"FAIL: {type(e).__name__} after {time.perf_counter() - started:.1f}s ({len(body)} bytes sent)")
+        lines = [json.loads(line) for line in r.text.splitlines()]
+        elapsed = time.perf_counter() - started
+        scored = sum("result" in line for line in lines)
+        print(f"{len(body)} bytes, {args.records} records: status {r.status_code}, {scored} scored in {elapsed:.2f}s")
+        if r.status_code != 200 or scored != args.records or [line["index"] for line in lines] != list(range(args.records)):
+            raise SystemExit("FAIL: missing, failed or out-of-order records")
+        print("OK")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    main()
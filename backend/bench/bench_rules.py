@@ -0,0 +1,84 @@
+"""Micro-benchmark: compiled RuleSet vs the original per-rule regex/`in` scans.
+
+    cd backend && python -m bench.bench_rules [--sizes 10000,1000000] [--extra-rules 0,200]
+
+Checks both implementations agree on every generated text, then reports the
+best-of-N scan time. `--extra-rules` pads the table with synthetic keywords to
+show how each approach scales with rule count; tables above
+`rules.FIND_MAX_KEYWORDS` keywords switch the compiled scan to its single regex pass.
+"""
+import argparse, random, re, string, time
+
+from app.rules import TEXT_RULES, VITAL_RULES, RuleSet, TextRule
+
+FILLER = ("patient report hemoglobin platelets within normal range follow up glucose sodium potassium "
+          "creatinine saturation 97 liver renal function values reference interval").split()
+FINDINGS = ("chest pain", "oxygen 88", "dyspnea", "faint", "shortness of breath")
+
+def legacy(txt: str, extra: list[str]) -> tuple[list[str], int, dict]:
+    # the pre-table rule_engine text scan, plus one extra `in` pass per padded keyword
+    alerts, ev = [], {}
+    if re.search(r"chest pain|pressure|tightness", txt):
+        alerts.append("Possible cardiac chest pain")
+    if re.search(r"shortness of breath|dyspnea", txt):
+        alerts.append("Respiratory distress")
+    m = re.search(r"oxygen[^0-9]*([0-9]{2})", txt)
+    if m:
+        spo2 = int(m.group(1))
+        ev["spo2"] = spo2
+        if spo2 < 92:
+            alerts.append("Low SpO₂")
+    for kw in extra:
+        if kw in txt:
+            alerts.append(kw)
+    score = 0
+    score += 2 if any(k in txt for k in ["chest pain", "faint", "collapse"]) else 0
+    score += 2 if "respiratory distress" in alerts else 0
+    score += 2 if "low spo₂" in [a.lower() for a in alerts] else 0
+    return alerts, score, ev
+
+def text(size: int, rng: random.Random, findings: int) -> str:
+    # long lab-report style filler with a few findings scattered through it
+    words, n = [], 0
+    while n < size:
+        w = rng.choice(FILLER)
+        words.append(w)
+        n += len(w) + 1
+    for _ in range(findings):
+        words.insert(rng.randrange(len(words)), rng.choice(FINDINGS))
+    return " ".join(words).lower()
+
+def best(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--extra-rules", default="0,50,500")
+    ap.add_argument("--findings", type=int, default=2, help="keyword hits scattered through each text")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    rng = random.Random(0)
+
+    for n_extra in map(int, args.extra_rules.split(",")):
+        extra = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 14))) for _ in range(n_extra)]
+        rules = RuleSet(TEXT_RULES + tuple(TextRule((kw,), alert=kw) for kw in extra), VITAL_RULES)
+        for size in map(int, args.sizes.split(",")):
+            txt = text(size, rng, args.findings)
+            if extra:
+                txt += " " + rng.choice(extra)
+            new_alerts, new_score, new_ev = rules.evaluate(txt)
+            old_alerts, old_score, old_ev = legacy(txt, extra)
+            assert (sorted(new_alerts), new_score, new_ev) == (sorted(old_alerts), old_score, old_ev), "implementations disagree"
+            t_old = best(lambda: legacy(txt, extra), args.repeat)
+            t_new = best(lambda: rules.evaluate(txt), args.repeat)
+            print(f"rules={len(rules.text_rules) + len(rules.vital_rules):>4}  text={size:>8}  legacy={t_old*1e3:8.2f} ms  compiled={t_new*1e3:8.2f} ms  "
+                  f"x{t_old / t_new:5.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Calibration check: reduced-scale and banded imaging metrics against full resolution.
+
+    cd backend && python -m bench.calibrate_imaging [--count 40] [--size 4000x3000] [--max-sides 2048,1024]
+
+Generates radiograph-like JPEGs (soft-tissue ellipses, line structures, a
+range of blur and sensor noise), runs `processing.imaging` at full resolution,
+in row bands, at each reduced `max_side` and with `max_pixels` forcing a 1/2 and
+1/4 scale decode (the path for uploads over IMAGING_MAX_BYTES), and reports the absolute error of
+`edge_density` and `blur_score` plus the log-log fit (median) of the edge-density
+scale exponent (`EDGE_SCALE_EXPONENT`). Reduced decodes carry no blur score, so
+only their edge density is checked. Exits non-zero when the p90 error of
+any mode exceeds the tolerances.
+"""
+import argparse, time
+
+import cv2
+import numpy as np
+
+from app import processing
+
+def synth(h: int, w: int, rng: np.random.Generator) -> np.ndarray:
+    blur, noise = float(rng.choice([0, .5, 1, 1.5, 2, 3, 4, 6])), float(rng.choice([0, 1, 2, 4, 8]))
+    img = np.full((h, w), rng.uniform(20, 80), np.float32)
+    for _ in range(rng.integers(5, 25)):
+        center = (int(rng.uniform(0, w)), int(rng.uniform(0, h)))
+        axes = (int(rng.uniform(w*.03, w*.3)), int(rng.uniform(h*.03, h*.3)))
+        cv2.ellipse(img, center, axes, rng.uniform(0, 180), 0, 360, float(rng.uniform(60, 230)), -1)
+    for _ in range(rng.integers(0, 40)):
+        p1 = (int(rng.uniform(0, w)), int(rng.uniform(0, h)))
+        p2 = (int(rng.uniform(0, w)), int(rng.uniform(0, h)))
+        cv2.line(img, p1, p2, float(rng.uniform(100, 255)), int(rng.integers(1, 12)))
+    if blur:
+        img = cv2.GaussianBlur(img, (0, 0), blur)
+    if noise:
+        img += rng.normal(0, noise, img.shape).astype(np.float32)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+def run(src: bytes, **kw) -> tuple[dict, float]:
+    t = time.perf_counter()
+    (metrics, _), _ = processing.imaging(src, False, **kw)
+    return metrics, time.perf_counter() - t
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=40)
+    ap.add_argument("--size", default="4000x3000", help="HxW of the generated images")
+    ap.add_argument("--max-sides", default="2048,1024")
+    ap.add_argument("--edge-tolerance", type=float, default=0.015, help="max p90 |error| of edge_density")
+    ap.add_argument("--blur-tolerance", type=float, default=0.1, help="max p90 |error| of blur_score")
+    args = ap.parse_args()
+    h, w = map(int, args.size.split("x"))
+    rng = np.random.default_rng(0)
+    modes = {"banded": {"tile_pixels": 1}, **{f"max_side={m}": {"max_side": int(m)} for m in args.max_sides.split(",")},
+             **{f"decode 1/{f}": {"max_pixels": h * w // (f * f)} for f in (2, 4)}}
+    errors = {mode: {"edge_density": [], "blur_score": []} for mode in modes}
+    seconds = {mode: 0.0 for mode in ["full", *modes]}
+    fit = {mode: [] for mode in modes}
+
+    for _ in range(args.count):
+        gray = synth(h, w, rng)
+        _, buf = cv2.imencode(".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, 92])
+        src = buf.tobytes()
+        ref, t = run(src)
+        seconds["full"] += t
+        for mode, kw in modes.items():
+            got, t = run(src, **kw)
+            seconds[mode] += t
+            for key in ("edge_density", "blur_score"):
+                if got[key] is not None:  # reduced decodes report no blur score
+                    errors[mode][key].append(abs(got[key] - ref[key]))
+            if ("max_side" in kw or "max_pixels" in kw) and ref["edge_density"] > 0:
+                scale = max(h, w) / min(max(h, w) / got["decode_scale"], kw.get("max_side") or max(h, w))
+                raw = got["edge_density"] * scale**processing.EDGE_SCALE_EXPONENT
+                fit[mode].append((np.log(scale), np.log(raw / ref["edge_density"])))
+
+    ok = True
+    print(f"{args.count} images {h}x{w}; full resolution {seconds['full'] / args.count * 1e3:.0f} ms/image")
+    for mode in modes:
+        line = [f"{mode:>14}  {seconds[mode] / args.count * 1e3:6.0f} ms/image"]
+        for key, tol in (("edge_density", args.edge_tolerance), ("blur_score", args.blur_tolerance)):
+            if not errors[mode][key]:
+                continue
+            e = np.array(errors[mode][key])
+            p90 = float(np.quantile(e, .9))
+            ok &= p90 <= tol
+            line.append(f"{key} |err| mean={e.mean():.4f} p90={p90:.4f} max={e.max():.4f} {'ok' if p90 <= tol else 'OVER'}")
+        if fit[mode]:
+            x, y = np.array(fit[mode]).T
+            line.append(f"edge exponent fit={float(np.median(y / x)):.2f}")
+        print("  ".join(line))
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
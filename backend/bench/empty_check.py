@@ -0,0 +1,36 @@
+"""Regression check: empty uploads get a 4xx, never a 500.
+
+    cd backend && python -m bench.empty_check
+
+Posts zero-byte images and PDFs in-process, with cost quotas on so the cost
+probes (image header, page count) run before the analyses, and exits
+non-zero if any answer is not a 4xx.
+"""
+import os, sys, tempfile
+
+def main():
+    d = tempfile.mkdtemp()
+    os.environ.update(API_KEY="", API_KEYS="", RATELIMIT_ENABLED="1", RATELIMIT_STORAGE_URI="memory://",
+                      WORKER_POOL_KIND="thread", BLOB_DIR=os.path.join(d, "blobs"), UPLOADS_DIR=os.path.join(d, "uploads"),
+                      JOBS_DIR=os.path.join(d, "jobs"))
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    posts = [
+        ("/imaging", {"file": ("empty.jpg", b"", "image/jpeg")}),
+        ("/jobs/imaging", {"file": ("empty.jpg", b"", "image/jpeg")}),
+        ("/ocr", {"file": ("empty.pdf", b"", "application/pdf")}),
+        ("/jobs/ocr", {"file": ("empty.pdf", b"", "application/pdf")}),
+        ("/analyze", {"image": ("empty.jpg", b"", "image/jpeg")}),
+    ]
+    failed = False
+    with TestClient(app, raise_server_exceptions=False) as c:
+        for path, files in posts:
+            r = c.post(path, files=files)
+            ok = 400 <= r.status_code < 500
+            failed |= not ok
+            print(f"{path:>14}  {r.status_code}  {r.text[:80]}  {'ok' if ok else 'FAIL'}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
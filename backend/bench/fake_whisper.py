@@ -0,0 +1,40 @@
+"""Local stand-in for the OpenAI transcription endpoint, with tunable latency.
+
+    cd backend && python -m bench.fake_whisper --port 8765 --latency 0.3 --jitter 0.1
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1 (and any
+non-empty OPENAI_API_KEY). It drains the multipart upload, sleeps
+latency ± jitter seconds and answers like Whisper's JSON response.
+"""
+import argparse, asyncio, random
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+def build(latency: float, jitter: float, status: int = 200) -> Starlette:
+    async def transcriptions(request: Request):
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        if status != 200:
+            return JSONResponse({"error": {"message": "fake upstream error"}}, status_code=status)
+        return JSONResponse({"text": f"fake transcription of {size} bytes: patient reports chest pain"})
+
+    return Starlette(routes=[Route("/v1/audio/transcriptions", transcriptions, methods=["POST"])])
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.3, help="seconds per transcription")
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--status", type=int, default=200, help="answer every request with this status")
+    args = ap.parse_args()
+    uvicorn.run(build(args.latency, args.jitter, args.status), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
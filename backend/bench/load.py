@@ -0,0 +1,221 @@
+"""Load and latency benchmark for /triage, /ocr, /imaging and /asr.
+
+    cd backend && python -m bench.load [--mode inprocess|uvicorn] [--concurrency 8] [--requests 100]
+                                       [--cases triage,ocr_sample,ocr_large,imaging,imaging_preview,asr]
+                                       [--whisper-latency 0.3] [--out results.json] [--compare old.json]
+
+Drives each case at the given concurrency and reports status counts, p50/p95/p99
+latency, throughput, and peak RSS of the server, including pool workers. In
+`uvicorn` mode the server is a subprocess; in `inprocess` mode the app runs in this
+process behind httpx's ASGI transport. Transcription goes to bench/fake_whisper.py,
+started on a free port with the given latency. Uploads get unique trailing bytes
+per request so caches stay cold; `--warm-cache` sends identical bodies instead.
+Results are written as JSON, by default to bench/results/load-<commit>.json, and
+`--compare` prints the change against an earlier run.
+"""
+import argparse, asyncio, io, json, os, socket, subprocess, sys, time, wave
+from pathlib import Path
+
+import cv2
+import fitz
+import httpx
+import numpy as np
+import psutil
+
+from bench.calibrate_imaging import synth
+
+BACKEND = Path(__file__).resolve().parent.parent
+TRIAGE = {"transcript_text": "patient reports chest pain and shortness of breath", "lab_text": "oxygen 89 hemoglobin 13"}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_up(url: str, proc: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{url} exited with {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up")
+
+# ---------- inputs ----------
+def large_pdf(pages: int) -> bytes:
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Lab report page {i + 1}\n" + "hemoglobin 13.2 g/dL platelets 250 oxygen 97\n" * 40)
+    return doc.tobytes()
+
+def image(h: int, w: int) -> bytes:
+    _, buf = cv2.imencode(".jpg", synth(h, w, np.random.default_rng(0)), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buf.tobytes()
+
+def audio(seconds: float) -> bytes:
+    t = np.arange(int(16000 * seconds)) / 16000
+    pcm = (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16)
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(pcm.tobytes())
+    return out.getvalue()
+
+def cases(args) -> dict:
+    # name -> (path, body(i) -> httpx request kwargs); trailing bytes keep each upload's hash unique
+    sample = (BACKEND / "samples" / "sample.pdf").read_bytes()
+    big = large_pdf(args.pdf_pages)
+    h, w = map(int, args.image_size.split("x"))
+    jpg = image(h, w)
+    wav = audio(args.audio_seconds)
+    tail = (lambda i: b"") if args.warm_cache else (lambda i: b"\n%% bench %d\n" % i)
+    return {
+        "triage": ("/triage", lambda i: {"json": TRIAGE}),
+        "ocr_sample": ("/ocr", lambda i: {"files": {"file": ("sample.pdf", sample + tail(i), "application/pdf")}}),
+        "ocr_large": ("/ocr", lambda i: {"files": {"file": ("large.pdf", big + tail(i), "application/pdf")}}),
+        "imaging": ("/imaging", lambda i: {"files": {"file": ("scan.jpg", jpg + tail(i), "image/jpeg")}}),
+        "imaging_preview": ("/imaging", lambda i: {"files": {"file": ("scan.jpg", jpg + tail(i), "image/jpeg")},
+                                                   "data": {"preview": "true"}}),
+        "asr": ("/asr", lambda i: {"files": {"file": ("note.wav", wav + tail(i), "audio/wav")}}),
+    }
+
+# ---------- driver ----------
+def rss(proc: psutil.Process) -> int:
+    total = 0
+    for p in [proc, *proc.children(recursive=True)]:
+        try:
+            total += p.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+async def run_case(client: httpx.AsyncClient, path: str, body, n: int, concurrency: int, server: psutil.Process) -> dict:
+    latencies, statuses = [], {}
+    peak = rss(server)
+    next_i = 0
+
+    async def worker():
+        nonlocal next_i
+        while next_i < n:
+            i, next_i = next_i, next_i + 1
+            kwargs = body(i)
+            t = time.perf_counter()
+            try:
+                status = (await client.post(path, **kwargs)).status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - t)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    async def sample_rss():
+        nonlocal peak
+        while True:
+            peak = max(peak, rss(server))
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    sampler.cancel()
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": n, "concurrency": concurrency, "status": statuses,
+        "p50_ms": round(float(np.percentile(ms, 50)), 1), "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1), "mean_ms": round(float(ms.mean()), 1),
+        "throughput_rps": round(n / wall, 2), "peak_rss_mb": round(peak / 2**20, 1),
+    }
+
+async def drive(args, base_url: str, server: psutil.Process, transport=None) -> dict:
+    results = {}
+    all_cases = cases(args)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=args.timeout,
+                                 headers={"X-API-Key": os.environ.get("API_KEY", "")}) as client:
+        for name in args.cases.split(","):
+            path, body = all_cases[name]
+            for i in range(args.warmup):
+                await client.post(path, **body(-1 - i))
+            results[name] = await run_case(client, path, body, args.requests, args.concurrency, server)
+            r = results[name]
+            print(f"{name:>16}  p50={r['p50_ms']:8.1f}  p95={r['p95_ms']:8.1f}  p99={r['p99_ms']:8.1f} ms  "
+                  f"{r['throughput_rps']:7.2f} req/s  peak RSS {r['peak_rss_mb']:7.1f} MB  {r['status']}", flush=True)
+    return results
+
+async def inprocess(args) -> dict:
+    from app.main import app
+    async with app.router.lifespan_context(app):
+        return await drive(args, "http://bench", psutil.Process(), httpx.ASGITransport(app=app))
+
+def under_uvicorn(args, env: dict) -> dict:
+    port = free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(args.workers),
+           "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=BACKEND, env=env)
+    try:
+        wait_up(f"http://127.0.0.1:{port}/health", proc)
+        return asyncio.run(drive(args, f"http://127.0.0.1:{port}", psutil.Process(proc.pid)))
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+def compare(results: dict, old_path: str) -> None:
+    old = json.loads(Path(old_path).read_text())
+    print(f"\nvs {old_path} ({old.get('commit', '?')[:10]})")
+    for name, r in results.items():
+        o = old["results"].get(name)
+        if o:
+            print(f"{name:>16}  " + "  ".join(f"{k}={r[k]:.1f} ({(r[k] - o[k]) / o[k] * 100:+.0f}%)" if o[k] else f"{k}={r[k]:.1f}"
+                                             for k in ("p50_ms", "p95_ms", "throughput_rps", "peak_rss_mb")))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["inprocess", "uvicorn"], default="uvicorn")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    ap.add_argument("--cases", default="triage,ocr_sample,ocr_large,imaging,imaging_preview,asr")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=100, help="per case")
+    ap.add_argument("--warmup", type=int, default=2, help="untimed requests per case")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--pdf-pages", type=int, default=100)
+    ap.add_argument("--image-size", default="3000x4000", help="HxW of the synthetic image")
+    ap.add_argument("--audio-seconds", type=float, default=10)
+    ap.add_argument("--whisper-latency", type=float, default=0.3)
+    ap.add_argument("--whisper-jitter", type=float, default=0.05)
+    ap.add_argument("--warm-cache", action="store_true", help="send identical bodies so result caches hit")
+    ap.add_argument("--out", help="default: bench/results/load-<commit>.json")
+    ap.add_argument("--compare", help="an earlier results JSON to diff against")
+    args = ap.parse_args()
+
+    wport = free_port()
+    whisper = subprocess.Popen([sys.executable, "-m", "bench.fake_whisper", "--port", str(wport),
+                                "--latency", str(args.whisper_latency), "--jitter", str(args.whisper_jitter)], cwd=BACKEND)
+    env = {**os.environ, "OPENAI_BASE_URL": f"http://127.0.0.1:{wport}/v1", "OPENAI_API_KEY": "bench",
+           "RATELIMIT_ENABLED": "0"}
+    try:
+        wait_up(f"http://127.0.0.1:{wport}/", whisper)
+        if args.mode == "inprocess":
+            os.environ.update(env)
+            results = asyncio.run(inprocess(args))
+        else:
+            results = under_uvicorn(args, env)
+    finally:
+        whisper.terminate()
+        whisper.wait(10)
+
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND, capture_output=True, text=True).stdout.strip()
+    out = Path(args.out or BACKEND / "bench" / "results" / f"load-{commit[:10] or 'nogit'}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "compare")}
+    out.write_text(json.dumps({"commit": commit, "time": int(time.time()), "config": config, "results": results}, indent=2))
+    print(f"wrote {out}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
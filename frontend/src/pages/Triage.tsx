@@ -14,56 +14,47 @@ export default function Triage() {
   const [busy, setBusy] = useState(false);
   const headers = { "X-API-Key": KEY };
 
-  async function post(url: string, fd: FormData) {
-    const r = await fetch(url, { method: "POST", headers, body: fd });
-    if (!r.ok) throw new Error(await r.text());
-    return r.json();
-  }
-
   async function run() {
     setBusy(true);
     setResult(null);
     try {
-      const asrP = audio
-        ? (() => {
-            const f = new FormData();
-            f.append("file", audio!);
-            return post(`${API}/asr`, f);
-          })()
-        : Promise.resolve(null);
-
-      const ocrP = pdf
-        ? (() => {
-            const f = new FormData();
-            f.append("file", pdf!);
-            return post(`${API}/ocr`, f);
-          })()
-        : Promise.resolve(null);
-
-      const imgP = img
-        ? (() => {
-            const f = new FormData();
-            f.append("file", img!);
-            f.append("preview", "true");
-            return post(`${API}/imaging`, f);
-          })()
-        : Promise.resolve(null);
-
-      const [asr, ocr, im] = await Promise.all([asrP, ocrP, imgP]);
-
-      const payload = {
-        transcript_text: asr?.text ?? null,
-        lab_text: ocr?.text ?? null,
-        imaging: im?.metrics ?? null,
-      };
+      // one upload; the server runs ASR/OCR/imaging concurrently and streams
+      // each stage back as a server-sent event, ending with the triage verdict
+      const f = new FormData();
+      if (audio) f.append("audio", audio);
+      if (pdf) f.append("pdf", pdf);
+      if (img) {
+        f.append("image", img);
+        f.append("preview", "true");
+      }
+      const r = await fetch(`${API}/analyze`, { method: "POST", headers, body: f });
+      if (!r.ok || !r.body) throw new Error(await r.text());
 
-      const r = await fetch(`${API}/triage`, {
-        method: "POST",
-        headers: { ...headers, "Content-Type": "application/json" },
-        body: JSON.stringify(payload),
-      });
-      const data = await r.json();
-      setResult({ ...data, asr, ocr, preview_b64: im?.preview_b64 ?? null });
+      const reader = r.body.pipeThrough(new TextDecoderStream()).getReader();
+      const errors: string[] = [];
+      let buf = "";
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buf += value;
+        let sep: number;
+        while ((sep = buf.indexOf("\n\n")) >= 0) {
+          const raw = buf.slice(0, sep);
+          buf = buf.slice(sep + 2);
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] ?? "null");
+          if (event === "error") {
+            errors.push(`${data.stage}: ${data.detail}`);
+          } else if (event === "triage") {
+            setResult((prev: any) => ({ ...prev, ...data }));
+          } else if (event === "imaging") {
+            setResult((prev: any) => ({ ...prev, imaging: data, preview_url: data.preview_url ?? null }));
+          } else if (event) {
+            setResult((prev: any) => ({ ...prev, [event]: data }));
+          }
+        }
+      }
+      if (errors.length) alert(errors.join("\n"));
     } catch (e: any) {
       alert(e.message || "Error");
     } finally {
@@ -127,16 +118,16 @@ export default function Triage() {
         <Card>
           <CardContent className="p-4 space-y-2">
             <div>
-              Risk: <b>{result.risk_level}</b>
+              Risk: <b>{result.risk_level ?? (busy ? "…" : "n/a")}</b>
             </div>
             {result.emergency_alerts?.length > 0 && (
               <div className="text-red-600">
                 Alerts: {result.emergency_alerts.join(", ")}
               </div>
             )}
-            {result.preview_b64 && (
+            {result.preview_url && (
               <img
-                src={result.preview_b64}
+                src={result.preview_url}
                 alt="overlay"
                 className="max-w-md border"
               />